@@ -0,0 +1,156 @@
+"""
+Client benchmark against a local SmartSchool stand-in (benchmarks/fake_server.py)
+How to use:
+python `benchmarks/bench_client.py [requests_per_endpoint]`
+
+Reports requests/second and p50/p99 latency per endpoint, parse time per
+message, memory per account and WebSocket notifications per second. Exits
+with status 1 when the ETag endpoints are not revalidated with 304 replies.
+"""
+import sys
+import time
+import tracemalloc
+
+from smartschoolapi_tkbstudios import ClientManager, SmartSchoolClient
+
+from fake_server import FakeSmartSchool, message_list_xml
+
+
+def make_client(server, **kwargs):
+    """
+    Authenticated client of the stand-in server
+    """
+    client = SmartSchoolClient(server.domain, scheme='http',
+                               websocket_url=server.websocket_url, **kwargs)
+    client.phpsessid = 'phpsessid'
+    client.pid = 'pid'
+    client.user_id = '1'
+    client.platform_id = '1'
+    return client
+
+
+def percentile(samples, fraction):
+    """
+    Value below which fraction of the sorted samples fall
+    """
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def bench_endpoint(name, call, count):
+    """
+    Call an endpoint count times in a row and print its throughput and latency
+    """
+    call()  # warm up the connection
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        before = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - before)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"{name:28} {count / elapsed:8.0f} req/s"
+          f"  p50 {percentile(latencies, 0.5) * 1000:7.2f} ms"
+          f"  p99 {percentile(latencies, 0.99) * 1000:7.2f} ms")
+
+
+def bench_revalidated(server, name, call, count):
+    """
+    bench_endpoint for an ETag endpoint, returns whether every timed call got a 304
+
+    The warm up call stores the ETag, so each timed call should be revalidated.
+    """
+    before = server.not_modified
+    bench_endpoint(name, call, count)
+    not_modified = server.not_modified - before
+    if not_modified != count:
+        print(f"{'':28} only {not_modified} of {count} calls were answered with 304")
+        return False
+    return True
+
+
+def bench_concurrent(client, count):
+    """
+    Fetch count messages with get_messages_by_ids and print the throughput
+    """
+    start = time.perf_counter()
+    fetched = sum(1 for _ in client.get_messages_by_ids(range(count), max_workers=8))
+    elapsed = time.perf_counter() - start
+    print(f"{'get_messages_by_ids (8)':28} {fetched / elapsed:8.0f} req/s")
+
+
+def bench_parse(count):
+    """
+    Print the time to parse one message of a count message listing
+    """
+    body = message_list_xml(0, count).encode()
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        SmartSchoolClient.parse_message_response(body)
+        timings.append(time.perf_counter() - start)
+    print(f"{'parse message list':28} {min(timings) / count * 1e6:8.2f} us/message"
+          f"  ({count} messages)")
+
+
+def bench_accounts(server, count):
+    """
+    Print the memory held per account of a ClientManager
+    """
+    tracemalloc.start()
+    manager = ClientManager()
+    for account in range(count):
+        manager.add_account(account, server.domain, 'phpsessid', 'pid', str(account), '1',
+                            scheme='http')
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    manager.close()
+    print(f"{'memory per account':28} {current / count / 1024:8.1f} KiB  ({count} accounts)")
+
+
+def bench_websocket(server):
+    """
+    Print the notifications received per second over the WebSocket
+    """
+    client = make_client(server)
+    client.get_token_from_api()
+    received = []
+
+    def callback(message):
+        if message.get('text') == 'pubsub message':
+            received.append(message)
+
+    client.received_message_callback = callback
+    start = time.perf_counter()
+    client.run_websocket(reconnect=False)
+    elapsed = time.perf_counter() - start
+    print(f"{'websocket notifications':28} {len(received) / elapsed:8.0f} events/s"
+          f"  ({len(received)} events)")
+
+
+if __name__ == '__main__':
+    COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    with FakeSmartSchool(messages=1000, notifications=20_000) as SERVER:
+        CLIENT = make_client(SERVER)
+        bench_endpoint('check_if_authenticated', CLIENT.check_if_authenticated, COUNT)
+        bench_endpoint('list_messages (1000)', CLIENT.list_messages, COUNT // 10)
+        bench_endpoint('get_message_by_id', lambda: CLIENT.get_message_by_id(1), COUNT)
+        bench_endpoint('list_message_attachments', lambda: CLIENT.list_message_attachments(1),
+                       COUNT)
+        REVALIDATED = all([
+            bench_revalidated(SERVER, 'get_results (304)', CLIENT.get_results, COUNT),
+            bench_revalidated(SERVER, 'get_planner (7 days, 304)',
+                              lambda: CLIENT.get_planner('2024-03-04', '2024-03-10'), COUNT),
+        ])
+        bench_endpoint('get_upload_zone_dir', lambda: CLIENT.get_upload_zone_dir(1), COUNT)
+        bench_endpoint('walk_upload_zone (31 dirs)',
+                       lambda: list(CLIENT.walk_upload_zone(1)), COUNT // 10)
+        bench_endpoint('get_helpdesk_tickets_filters', CLIENT.get_helpdesk_tickets_filters,
+                       COUNT)
+        bench_concurrent(CLIENT, COUNT)
+        bench_parse(10_000)
+        bench_accounts(SERVER, 1000)
+        bench_websocket(SERVER)
+        CLIENT.close()
+    sys.exit(0 if REVALIDATED else 1)
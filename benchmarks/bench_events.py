@@ -0,0 +1,66 @@
+"""
+Websocket event decoding benchmark: events decoded per second
+How to use:
+python `benchmarks/bench_events.py [count]`
+
+decode_event also decodes the JSON nested in pubsub notifications, which the
+old if/elif decoding never looked at.
+"""
+import json
+import sys
+import time
+
+from smartschoolapi_tkbstudios import SmartSchoolClient, events
+
+from fake_server import notification
+
+
+def if_elif_decode(frame):
+    """
+    Decoding as ws_on_message did before the typed events: json and an if/elif chain,
+    the nested notification JSON is left undecoded
+    """
+    message_data = json.loads(frame)
+    message_type = message_data.get("type", None)
+    message_request = message_data.get("request", None)
+    if message_type is not None:
+        if message_type == "auth" and message_request == "getToken":
+            pass
+        elif message_type == "notificationListStart":
+            pass
+        elif message_type == "getNotificationConfig":
+            pass
+    return message_data
+
+
+def measure(name, decode, frames):
+    """
+    Print the events per second of decode over frames, best of 5
+    """
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for frame in frames:
+            decode(frame)
+        timings.append(time.perf_counter() - start)
+    print(f"{name:32} {len(frames) / min(timings):10.0f} events/s")
+
+
+if __name__ == '__main__':
+    COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    FRAMES = [notification(index) for index in range(COUNT)]
+
+    measure('json + if/elif (outer only)', if_elif_decode, FRAMES)
+    ORJSON = events.orjson
+    events.orjson = None
+    measure('decode_event (json)', events.decode_event, FRAMES)
+    events.orjson = ORJSON
+    if ORJSON is not None:
+        measure('decode_event (orjson)', events.decode_event, FRAMES)
+    else:
+        print("decode_event (orjson)            orjson is not installed")
+
+    CLIENT = SmartSchoolClient('127.0.0.1', loglevel=None)
+    CLIENT.received_message_callback = lambda message_data: None
+    CLIENT.event_handlers.register(events.Notification, lambda event: None)
+    measure('ws_on_message (handlers)', lambda frame: CLIENT.ws_on_message(None, frame), FRAMES)
@@ -0,0 +1,68 @@
+"""
+Import time benchmark: cost of importing the package and the sync client
+How to use:
+python `benchmarks/bench_import_time.py [scale]`
+
+Exits with status 1 when an import exceeds its budget, or when a
+dependency that should load lazily is imported anyway. scale multiplies
+every budget, for slower machines.
+"""
+import re
+import subprocess
+import sys
+
+RUNS = 5
+
+# statement -> (budget in ms, modules that must not be imported)
+CASES = {
+    'import smartschoolapi_tkbstudios': (
+        20, ('requests', 'aiohttp', 'websocket', 'colorlog', 'xml.etree.ElementTree'),
+    ),
+    'from smartschoolapi_tkbstudios import SmartSchoolClient': (
+        200, ('aiohttp', 'websocket', 'colorlog', 'xml.etree.ElementTree', 'asyncio', 'sqlite3'),
+    ),
+}
+
+IMPORT_TIME = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \|( +)(\S+)$')
+
+
+def import_time(statement, startup_modules=frozenset()):
+    """
+    Return the import time of statement in microseconds and the names of every
+    module it imports, in a fresh interpreter
+
+    Modules in startup_modules (imported by the interpreter startup) are not counted.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        capture_output=True, text=True, check=True
+    )
+    total = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match is None:
+            continue
+        cumulative, indent, module = match.groups()
+        modules.add(module)
+        if len(indent) == 1 and module not in startup_modules:
+            total += int(cumulative)
+    return total, modules
+
+
+if __name__ == '__main__':
+    STARTUP = import_time('pass')[1]
+    SCALE = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    failed = False
+    for STATEMENT, (budget, lazy_modules) in CASES.items():
+        runs = [import_time(STATEMENT, STARTUP) for _ in range(RUNS)]
+        best = min(total for total, _ in runs) / 1000
+        loaded = sorted(set(lazy_modules) & runs[0][1])
+        over_budget = best > budget * SCALE
+        failed = failed or over_budget or bool(loaded)
+        print(f"{STATEMENT}")
+        print(f"  best of {RUNS}: {best:8.1f} ms (budget {budget * SCALE:.0f} ms)"
+              f"{'  OVER BUDGET' if over_budget else ''}")
+        if loaded:
+            print(f"  eagerly imported: {', '.join(loaded)}")
+    sys.exit(1 if failed else 0)
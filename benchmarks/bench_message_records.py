@@ -0,0 +1,58 @@
+"""
+Memory benchmark: message dicts vs slotted MessageSummary records
+How to use:
+python `benchmarks/bench_message_records.py [count]`
+"""
+import sys
+import tracemalloc
+from smartschoolapi_tkbstudios import MessageSummary
+
+
+def make_message(index):
+    """
+    Build a message dict as returned by SmartSchoolClient.parse_message_response
+    """
+    return {
+        'id': str(100000 + index),
+        'from': f'Teacher {index % 200}',
+        'from_image': f'https://example.smartschool.be/smsc/img/{index % 200}.png',
+        'subject': f'Subject of message {index}',
+        'date': f'2024-03-{index % 28 + 1:02d}T14:05:00+01:00',
+        'status': str(index % 2),
+        'attachment': '1' if index % 3 == 0 else '0',
+        'unread': str(index % 2),
+        'label': '0',
+        'deleted': '0',
+        'allow_reply': '1',
+        'allow_reply_enabled': '1',
+        'has_reply': '0',
+        'has_forward': '0',
+        'real_box': 'inbox',
+        'send_date': f'2024-03-{index % 28 + 1:02d}T14:05:00+01:00',
+    }
+
+
+def measure(build, count):
+    """
+    Return the bytes held by the objects built by build(count)
+    """
+    tracemalloc.start()
+    objects = build(count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return current
+
+
+if __name__ == '__main__':
+    COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    dicts_size = measure(lambda count: [make_message(i) for i in range(count)], COUNT)
+    records_size = measure(
+        lambda count: [MessageSummary.from_dict(make_message(i)) for i in range(count)], COUNT
+    )
+
+    print(f"{COUNT} messages")
+    print(f"dicts:   {dicts_size / 1024 / 1024:8.1f} MiB ({dicts_size / COUNT:6.0f} B/message)")
+    print(f"records: {records_size / 1024 / 1024:8.1f} MiB ({records_size / COUNT:6.0f} B/message)")
+    print(f"saved:   {100 - records_size * 100 / dicts_size:8.1f} %")
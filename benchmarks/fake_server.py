@@ -0,0 +1,387 @@
+"""
+Local SmartSchool stand-in serving fixture responses over HTTP and WebSocket
+
+Responses have the shape of the real endpoints (Messages dispatcher, results,
+planner, upload zone, helpdesk, token and notification WebSocket) so the
+client runs its normal code paths, without the network in the way. Results
+and planner send an ETag and answer a matching If-None-Match with 304 Not
+Modified, so repeated calls run the client's revalidation path.
+
+Usage:
+    with FakeSmartSchool(messages=1000) as server:
+        client = SmartSchoolClient(server.domain, scheme='http',
+                                   websocket_url=server.websocket_url)
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import re
+import threading
+
+from aiohttp import WSMsgType, web
+
+PARAM = re.compile(r'<param name="([^"]+)"><!\[CDATA\[(.*?)\]\]></param>', re.S)
+ACTION = re.compile(r'<action>(.*?)</action>')
+TOKEN = 'fake-token'
+
+
+def dispatcher_response(action, data):
+    """
+    Wrap dispatcher data in the envelope sent by the Messages dispatcher
+    """
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<server><response><status>ok</status><actions><action>'
+        f'<subsystem>postboxes</subsystem><command>{action}</command>'
+        f'<data>{data}</data>'
+        '</action></actions></response></server>'
+    )
+
+
+def message_summary_xml(message_id):
+    """
+    One message of a "message list" response
+    """
+    day = message_id % 28 + 1
+    return (
+        '<message>'
+        f'<id>{message_id}</id>'
+        f'<from><![CDATA[Teacher {message_id % 200}]]></from>'
+        f'<fromImage>https://example.smartschool.be/smsc/img/{message_id % 200}.png</fromImage>'
+        f'<subject><![CDATA[Subject of message {message_id}]]></subject>'
+        f'<date>2024-03-{day:02d}T14:05:00+01:00</date>'
+        f'<status>{message_id % 2}</status>'
+        f'<attachment>{1 if message_id % 3 == 0 else 0}</attachment>'
+        f'<unread>{message_id % 2}</unread>'
+        '<label>0</label><deleted>0</deleted>'
+        '<allowreply>1</allowreply><allowreplyenabled>1</allowreplyenabled>'
+        '<hasreply>0</hasreply><hasForward>0</hasForward>'
+        '<realBox>inbox</realBox>'
+        f'<sendDate>2024-03-{day:02d}T14:05:00+01:00</sendDate>'
+        '</message>'
+    )
+
+
+def message_list_xml(offset, limit):
+    """
+    "message list" response with the messages offset to offset + limit
+    """
+    messages = ''.join(map(message_summary_xml, range(offset, offset + limit)))
+    return dispatcher_response('message list', f'<messages>{messages}</messages>')
+
+
+def message_xml(message_id):
+    """
+    "show message" response
+    """
+    body = '<p>' + 'Lorem ipsum dolor sit amet. ' * 40 + '</p>'
+    return dispatcher_response('show message', (
+        '<message>'
+        f'<id>{message_id}</id>'
+        f'<from><![CDATA[Teacher {message_id % 200}]]></from>'
+        '<to><![CDATA[Student]]></to>'
+        f'<subject><![CDATA[Subject of message {message_id}]]></subject>'
+        '<date>2024-03-04T14:05:00+01:00</date>'
+        f'<body><![CDATA[{body}]]></body>'
+        '<status>1</status><attachment>1</attachment><unread>0</unread><label>0</label>'
+        '<receivers><to>Student</to></receivers><ccreceivers/><bccreceivers/>'
+        '<senderPicture>https://example.smartschool.be/smsc/img/1.png</senderPicture>'
+        '<markedInLVS>0</markedInLVS><fromTeam>0</fromTeam>'
+        '<totalNrOtherToReciviers>0</totalNrOtherToReciviers>'
+        '<totalnrOtherCcReceivers>0</totalnrOtherCcReceivers>'
+        '<totalnrOtherBccReceivers>0</totalnrOtherBccReceivers>'
+        '<canReply>1</canReply><hasReply>0</hasReply><hasForward>0</hasForward>'
+        '<sendDate>2024-03-04T14:05:00+01:00</sendDate>'
+        '</message>'
+    ))
+
+
+def attachment_list_xml(message_id):
+    """
+    "attachment list" response with two attachments
+    """
+    attachments = ''.join(
+        '<attachment>'
+        f'<fileID>{message_id * 10 + index}</fileID>'
+        f'<name>document-{index}.pdf</name><mime>application/pdf</mime>'
+        '<size>4096</size><icon>pdf</icon>'
+        '</attachment>'
+        for index in range(2)
+    )
+    return dispatcher_response('attachment list', f'<attachmentlist>{attachments}</attachmentlist>')
+
+
+def results_json(page, per_page, total):
+    """
+    One page of evaluations
+    """
+    first = (page - 1) * per_page
+    return [
+        {
+            'identifier': f'result-{index}',
+            'type': 'normal',
+            'name': f'Test {index}',
+            'graphic': {'type': 'percentage', 'color': 'green', 'value': 75,
+                        'description': '15/20'},
+            'date': '2024-03-04T00:00:00+01:00',
+            'gradebookOwner': {'name': {'startingWithFirstName': f'Teacher {index % 20}'}},
+            'courses': [{'id': index % 12, 'name': f'Course {index % 12}'}],
+            'doesCount': True,
+        }
+        for index in range(first, min(first + per_page, total))
+    ]
+
+
+def planner_json(from_date, to_date):
+    """
+    Planned elements, four lessons per day of the range
+    """
+    first_day = datetime.date.fromisoformat(from_date)
+    last_day = datetime.date.fromisoformat(to_date)
+    elements = []
+    for offset in range((last_day - first_day).days + 1):
+        day = (first_day + datetime.timedelta(days=offset)).isoformat()
+        for hour in range(8, 12):
+            elements.append({
+                'id': f'{day}-{hour}',
+                'name': f'Lesson {hour}',
+                'plannedElementType': 'planned-lessons',
+                'period': {
+                    'dateTimeFrom': f'{day}T{hour:02d}:00:00+01:00',
+                    'dateTimeTo': f'{day}T{hour:02d}:50:00+01:00',
+                    'wholeDay': False,
+                },
+                'courses': [{'id': hour, 'name': f'Course {hour}'}],
+            })
+    return elements
+
+
+def upload_zone_json(dir_id, depth, fanout):
+    """
+    Upload zone folder with fanout sub folders and fanout files, depth levels deep
+    """
+    level = 0 if dir_id == '0' else dir_id.count('-') + 1
+    children = [
+        {'data': {'title': f'file-{index}.pdf'}, 'attributes': {'id': f'{dir_id}.{index}'},
+         'hasChildren': False}
+        for index in range(fanout)
+    ]
+    if level < depth:
+        children += [
+            {'data': {'title': f'folder-{index}'},
+             'attributes': {'id': f'{dir_id}-{index}' if level else str(index + 1)}}
+            for index in range(fanout)
+        ]
+    return [{'data': {'title': dir_id}, 'attributes': {'id': dir_id}, 'children': children}]
+
+
+def notification(index):
+    """
+    Pubsub frame of a new message notification
+    """
+    return json.dumps({
+        'type': 'pubsub',
+        'text': 'pubsub message',
+        'message': json.dumps({
+            'type': 'notificationAlert',
+            'module': 'Messages',
+            'title': f'Teacher {index % 200}',
+            'description': f'Subject of message {index}',
+            'url': f'/?module=Messages&file=index&function=main&msgID={index}',
+            'userID': '1',
+        }),
+    })
+
+
+class FakeSmartSchool:  # pylint: disable=too-many-instance-attributes
+    """
+    Stand-in SmartSchool server running on its own event loop thread
+
+    Args:
+        messages: number of messages in the inbox
+        results: number of evaluations
+        notifications: number of notifications sent to each WebSocket before it closes
+        upload_zone_depth: depth of the upload zone tree
+        upload_zone_fanout: folders and files per upload zone folder
+
+    Attributes:
+        not_modified: number of 304 Not Modified replies sent so far
+    """
+
+    def __init__(self, messages: int = 1000, results: int = 500, notifications: int = 1000,
+                 upload_zone_depth: int = 2, upload_zone_fanout: int = 5):
+        self.messages = messages
+        self.results = results
+        self.notifications = notifications
+        self.upload_zone_depth = upload_zone_depth
+        self.upload_zone_fanout = upload_zone_fanout
+        self.not_modified = 0
+        self.port = None
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    @property
+    def domain(self) -> str:
+        """
+        Domain to give to the client, together with scheme='http'
+        """
+        return f'127.0.0.1:{self.port}'
+
+    @property
+    def websocket_url(self) -> str:
+        """
+        Notification WebSocket URL
+        """
+        return f'ws://127.0.0.1:{self.port}/smsc/websocket'
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def start(self):
+        """
+        Start serving on a free port
+        """
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+
+    def stop(self):
+        """
+        Stop serving and the event loop thread
+        """
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get('/', self.index)
+        app.router.add_post('/', self.module)
+        app.router.add_get('/Topnav/Node/getToken', self.token)
+        app.router.add_get('/results/api/v1/evaluations/', self.evaluations)
+        app.router.add_get('/planner/api/v1/planned-elements/user/{user}', self.planner)
+        app.router.add_get('/helpdesk/api/v1/filters/', self.helpdesk_filters)
+        app.router.add_get('/helpdesk/api/v1/tickets/filter/{filter_id}', self.helpdesk_tickets)
+        app.router.add_get('/smsc/websocket', self.websocket)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def index(self, _):
+        """
+        Home page, an authenticated session gets a 200
+        """
+        return web.Response(text='<html></html>', content_type='text/html')
+
+    async def token(self, _):
+        """
+        WebSocket token
+        """
+        return web.Response(text=TOKEN)
+
+    async def module(self, request):
+        """
+        POST /?module=...: Messages dispatcher and upload zone tree
+        """
+        if request.query.get('module') == 'Uploadzone':
+            form = await request.post()
+            return web.json_response(upload_zone_json(
+                form.get('id', '0'), self.upload_zone_depth, self.upload_zone_fanout
+            ))
+        form = await request.post()
+        command = form['command']
+        action = ACTION.search(command).group(1)
+        params = dict(PARAM.findall(command))
+        if action == 'message list':
+            offset = int(params.get('offset', 0))
+            limit = int(params.get('limit', self.messages))
+            body = message_list_xml(offset, max(min(limit, self.messages - offset), 0))
+        elif action == 'show message':
+            body = message_xml(int(params['msgID']))
+        elif action == 'attachment list':
+            body = attachment_list_xml(int(params['msgID']))
+        else:
+            body = dispatcher_response(action, '')
+        return web.Response(text=body, content_type='text/xml')
+
+    def conditional_json_response(self, request, data):
+        """
+        JSON response with an ETag, 304 Not Modified when If-None-Match still matches
+        """
+        body = json.dumps(data)
+        etag = f'"{hashlib.sha1(body.encode()).hexdigest()}"'
+        if request.headers.get('If-None-Match') == etag:
+            self.not_modified += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(text=body, content_type='application/json', headers={'ETag': etag})
+
+    async def evaluations(self, request):
+        """
+        Results, paged by pageNumber and itemsOnPage, revalidated with ETag
+        """
+        return self.conditional_json_response(request, results_json(
+            int(request.query.get('pageNumber', 1)),
+            int(request.query.get('itemsOnPage', 50)),
+            self.results
+        ))
+
+    async def planner(self, request):
+        """
+        Planned elements of a date range, revalidated with ETag
+        """
+        return self.conditional_json_response(
+            request, planner_json(request.query['from'], request.query['to'])
+        )
+
+    async def helpdesk_filters(self, _):
+        """
+        Helpdesk ticket filters
+        """
+        return web.json_response([
+            {'id': index, 'name': f'Filter {index}'} for index in range(5)
+        ])
+
+    async def helpdesk_tickets(self, request):
+        """
+        Helpdesk tickets of a filter
+        """
+        filter_id = request.match_info['filter_id']
+        return web.json_response([
+            {'id': f'{filter_id}-{index}', 'title': f'Ticket {index}', 'status': 'open'}
+            for index in range(20)
+        ])
+
+    async def websocket(self, request):
+        """
+        Notification WebSocket: checkToken, setConfig, then a burst of notifications
+        """
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                break
+            data = json.loads(message.data)
+            if data.get('type') == 'auth' and data.get('request') == 'checkToken':
+                if data.get('token') != TOKEN:
+                    await ws.send_str(json.dumps({'type': 'auth', 'request': 'checkToken',
+                                                  'text': 'invalid token'}))
+                    continue
+                await ws.send_str(json.dumps({'type': 'auth', 'request': 'getToken',
+                                              'text': 'ok'}))
+                await ws.send_str(json.dumps({'type': 'getNotificationConfig'}))
+            elif data.get('type') == 'setConfig':
+                try:
+                    await ws.send_str(json.dumps({'type': 'notificationListStart'}))
+                    for index in range(self.notifications):
+                        await ws.send_str(notification(index))
+                except ConnectionResetError:
+                    break
+                await ws.close()
+        return ws
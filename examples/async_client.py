@@ -0,0 +1,40 @@
+"""
+Asyncio client example
+Fetches every message body concurrently
+"""
+import os
+import logging
+import asyncio
+import dotenv
+from smartschoolapi_tkbstudios import AsyncSmartSchoolClient
+
+
+async def main():
+    """
+    Main
+    """
+    async with AsyncSmartSchoolClient(
+        domain=os.getenv('SMARTSCHOOL_DOMAIN'),
+        loglevel=logging.INFO,
+        max_concurrency=5,
+    ) as smart_school_client:
+        smart_school_client.phpsessid = os.getenv('SMARTSCHOOL_PHPSESSID')
+        smart_school_client.pid = os.getenv('SMARTSCHOOL_PID')
+        smart_school_client.user_id = os.getenv('SMARTSCHOOL_USER_ID')
+        smart_school_client.platform_id = os.getenv('SMARTSCHOOL_PLATFORM_ID')
+
+        await smart_school_client.check_if_authenticated()
+
+        messages = await smart_school_client.list_messages()
+        print(f"You have {len(messages)} messages.")
+
+        messages_data = await asyncio.gather(*(
+            smart_school_client.get_message_by_id(message['id']) for message in messages
+        ))
+        for message_data in messages_data:
+            print(f"{message_data['id']} - {message_data['from']}: {message_data['subject']}")
+
+
+if __name__ == '__main__':
+    dotenv.load_dotenv()
+    asyncio.run(main())
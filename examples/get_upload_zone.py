@@ -28,27 +28,12 @@ if __name__ == '__main__':
 
     smart_school_client.check_if_authenticated()
 
-    upload_zone_dir = smart_school_client.get_upload_zone_dir(course_id=course_id, dir_id="0")[0]
-
     print("Upload zone:")
-    print(f"ID: {upload_zone_dir['attributes']['id']}")
-    print(f"Title: {upload_zone_dir['data']['title']}")
-    print(f"State: {upload_zone_dir['state']}")
-    if upload_zone_dir['data']['icon'] != "":
-        print(f"Icon: {upload_zone_dir['data']['icon']}")
-    print(f"Has children: {'yes ' if upload_zone_dir['hasChildren'] else 'no'}")
-
-    for child in upload_zone_dir['children']:
+    for upload_zone_dir in smart_school_client.walk_upload_zone(course_id=course_id, concurrency=4):
+        print(f"ID: {upload_zone_dir['attributes']['id']}")
+        print(f"Title: {upload_zone_dir['data']['title']}")
+        print(f"State: {upload_zone_dir.get('state')}")
+        if upload_zone_dir['data'].get('icon'):
+            print(f"Icon: {upload_zone_dir['data']['icon']}")
+        print(f"Has children: {'yes' if upload_zone_dir.get('hasChildren') else 'no'}")
         print("")
-        child_data = smart_school_client.get_upload_zone_dir(
-            course_id=course_id,
-            dir_id=child['attributes']['id']
-        )[0]
-
-        print(f"ID: {child_data['attributes']['id']}")
-        print(f"Title: {child_data['data']['title']}")
-        print(f"State: {child_data['state']}")
-        print(f"Icon: {child_data['data']['icon']}")
-        print(f"Has children: {'yes ' if child_data['hasChildren'] else 'no'}")
-
-    print("")
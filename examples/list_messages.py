@@ -3,7 +3,6 @@ List messages example
 """
 import os
 import logging
-import time
 import dotenv
 from smartschoolapi_tkbstudios import SmartSchoolClient
 
@@ -26,8 +25,11 @@ if __name__ == '__main__':
     messages = smart_school_client.list_messages()
     print(f"You have {len(messages)} messages.")
 
-    for message in messages:
-        message_data = smart_school_client.get_message_by_id(message["id"])
+    for message_data in smart_school_client.get_messages_by_ids(
+            [message["id"] for message in messages],
+            max_workers=5,
+            rate_limit=2
+    ):
         print("Message data:")
         print(f"Message ID: {message_data['id']}")
         print(f"From: {message_data['from']}")
@@ -52,5 +54,3 @@ if __name__ == '__main__':
             f.write(f"Status: {'Read' if message_data['status'] == '1' else 'Unread'}\n")
             f.write(f"Attachment: {message_data['attachment']}\n")
             f.write(f"Body: {message_data['body']}\n")
-
-        time.sleep(1)
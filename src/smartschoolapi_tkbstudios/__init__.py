@@ -1,6 +1,78 @@
 """
 SmartSchool API wrapper
+
+Submodules are imported on first use of one of their names, so importing the
+package stays cheap for jobs that only need part of it.
 """
-from .smartschool import SmartSchoolClient
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .smartschool import SmartSchoolClient, ApiException, AuthException, ResultsException
+    from .async_smartschool import AsyncSmartSchoolClient
+    from .attachments import AttachmentStore
+    from .cache import ResponseCache, MemoryCache, DiskCache, PlannerCache
+    from .mailbox_sync import MailboxSync, MailboxChanges
+    from .manager import ClientManager, RequestStats
+    from .hub import NotificationHub, ConnectionHealth
+    from .events import (WebsocketEvent, AuthEvent, NotificationListStart,
+                         NotificationConfigRequest, Notification, EventRegistry,
+                         decode_event, register_event_type)
+    from .models import Message, MessageSummary
+    from .notifications import NotificationQueue, DROP_OLDEST, BLOCK, COALESCE
+
+# exported name -> submodule defining it
+_EXPORTS = {
+    "SmartSchoolClient": ".smartschool",
+    "ApiException": ".smartschool",
+    "AuthException": ".smartschool",
+    "ResultsException": ".smartschool",
+    "AsyncSmartSchoolClient": ".async_smartschool",
+    "AttachmentStore": ".attachments",
+    "ResponseCache": ".cache",
+    "MemoryCache": ".cache",
+    "DiskCache": ".cache",
+    "PlannerCache": ".cache",
+    "MailboxSync": ".mailbox_sync",
+    "MailboxChanges": ".mailbox_sync",
+    "ClientManager": ".manager",
+    "RequestStats": ".manager",
+    "NotificationHub": ".hub",
+    "ConnectionHealth": ".hub",
+    "WebsocketEvent": ".events",
+    "AuthEvent": ".events",
+    "NotificationListStart": ".events",
+    "NotificationConfigRequest": ".events",
+    "Notification": ".events",
+    "EventRegistry": ".events",
+    "decode_event": ".events",
+    "register_event_type": ".events",
+    "Message": ".models",
+    "MessageSummary": ".models",
+    "NotificationQueue": ".notifications",
+    "DROP_OLDEST": ".notifications",
+    "BLOCK": ".notifications",
+    "COALESCE": ".notifications",
+}
+
+__all__ = ["SmartSchoolClient", "ApiException", "AuthException", "ResultsException",
+           "AsyncSmartSchoolClient", "MailboxSync", "MailboxChanges",
+           "Message", "MessageSummary", "ResponseCache", "MemoryCache", "DiskCache",
+           "PlannerCache", "AttachmentStore", "ClientManager", "RequestStats",
+           "NotificationQueue", "DROP_OLDEST", "BLOCK", "COALESCE",
+           "NotificationHub", "ConnectionHealth", "WebsocketEvent", "AuthEvent",
+           "NotificationListStart", "NotificationConfigRequest", "Notification",
+           "EventRegistry", "decode_event", "register_event_type"]
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = ["SmartSchoolClient"]
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
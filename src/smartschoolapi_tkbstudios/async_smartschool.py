@@ -0,0 +1,495 @@
+"""
+SmartSchool asyncio client API class
+"""
+import asyncio
+import datetime
+import json
+import urllib
+
+import aiohttp
+
+from .models import Message, MessageSummary
+from .smartschool import (
+    DATE_PATTERN,
+    DEFAULT_TIMEOUT,
+    ApiException,
+    AuthException,
+    SmartSchoolClient,
+    get_loggers,
+    message_list_command,
+    postboxes_command,
+)
+
+
+class AsyncSmartSchoolClient:
+    """
+    SmartSchool asyncio client, mirrors SmartSchoolClient
+
+    Args:
+        domain: SmartSchool domain
+        loglevel: console logging level, None (default) leaves logging unconfigured
+        max_concurrency: maximum number of requests in flight for this client
+        limit: total connections of the pool (ignored when connector is given)
+        limit_per_host: connections per host of the pool (ignored when connector is given)
+        timeout: default request timeout in seconds
+        connector: aiohttp connector to use instead of creating one, allows sharing a pool
+        scheme: URL scheme of the domain, "http" for a local stand-in server
+
+    Attributes:
+        domain: SmartSchool domain
+        scheme: URL scheme of the domain
+        phpsessid: PHPSESSID
+        pid: pid
+        user_id: user id
+        platform_id: platform id
+
+    Usage:
+        async with AsyncSmartSchoolClient(domain) as client:
+            client.phpsessid = ...
+            messages = await client.list_messages()
+            bodies = await asyncio.gather(
+                *(client.get_message_by_id(message['id']) for message in messages)
+            )
+    """
+
+    def __init__(self, domain: str = None, loglevel: int = None,
+                 max_concurrency: int = 10, limit: int = 100, limit_per_host: int = 10,
+                 timeout: float = DEFAULT_TIMEOUT, connector: aiohttp.BaseConnector = None,
+                 scheme: str = 'https'):
+        self.domain = domain
+        self.scheme = scheme
+        self.platform_id = None
+        self.phpsessid = None
+        self.pid = None
+        self.user_id = None
+        self.user_token = None
+
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._connector = connector
+        self._connector_owner = connector is None
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._session = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.api_logger, self.websocket_logger, self.auth_logger = get_loggers(loglevel)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the session and, if owned, the connection pool
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self):
+        """
+        aiohttp session, created on first use inside the running loop
+        """
+        if self._session is None or self._session.closed:
+            if self._connector is None or self._connector.closed:
+                self._connector = aiohttp.TCPConnector(
+                    limit=self._limit,
+                    limit_per_host=self._limit_per_host
+                )
+            self._session = aiohttp.ClientSession(
+                connector=self._connector,
+                connector_owner=self._connector_owner,
+                timeout=self.timeout
+            )
+        return self._session
+
+    async def _request(self, method, path, **kwargs):
+        """
+        Send a request to the SmartSchool domain, the body is read before returning
+        """
+        cookies = {'PHPSESSID': self.phpsessid, 'pid': self.pid}
+        async with self._semaphore:
+            async with self.session.request(
+                    method,
+                    f'{self.scheme}://{self.domain}{path}',
+                    cookies={name: value for name, value in cookies.items() if value is not None},
+                    **kwargs
+            ) as response:
+                await response.read()
+                return response
+
+    async def check_if_authenticated(self):
+        """
+        Check if authenticated
+        """
+        if self.pid is None or self.phpsessid is None:
+            raise AuthException("PID or PHPSESSID are not set")
+        response = await self._request(
+            'GET',
+            '/',
+            allow_redirects=False
+        )
+        if response.status == 302:
+            raise AuthException("Not authenticated, invalid cookies (PID or PHPSESSID)")
+        if response.status != 200:
+            raise ApiException("Could not check if authenticated")
+        return True
+
+    async def get_token_from_api(self):
+        """
+        Get token from API
+        """
+        self.api_logger.info("Requesting token from API")
+        self.api_logger.debug("Sending request to get token")
+        response = await self._request(
+            'GET',
+            '/Topnav/Node/getToken',
+            json={
+                'userID': self.user_id
+            }
+        )
+        if response.status == 200:
+            self.api_logger.info("Token received")
+            self.user_token = await response.text()
+            return self.user_token
+        self.api_logger.error("Could not get token")
+        raise ApiException("Could not get token")
+
+    async def find_users_by_name(self, name):
+        """
+        Find users by name
+        """
+        self.api_logger.info("Requesting user from API")
+        self.api_logger.debug("Sending request to get user")
+        response = await self._request(
+            'POST',
+            '/?module=Messages&file=searchUsers',
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded",
+            },
+            data=f"val={name}&type=0&parentNodeId=insertSearchFieldContainer_0_0&xml=<results></results>"
+        )
+        if response.status == 200:
+            self.api_logger.info("User received")
+            return SmartSchoolClient.parse_users_response(await response.text())
+        self.api_logger.error("Could not get user")
+        raise ApiException("Could not get user")
+
+    async def list_messages(self, box_type: str = 'inbox', box_id: int = 0, typed: bool = False):
+        """
+        Request messages from API
+        Currently limited to maximum 50 messages, use iter_messages() to walk a whole box
+        """
+        messages = await self._list_messages(message_list_command(box_type, box_id))
+        if typed:
+            return [MessageSummary.from_dict(message) for message in messages]
+        return messages
+
+    async def iter_messages(self, box_type: str = 'inbox', box_id: int = 0, page_size: int = 50,
+                            typed: bool = False):
+        """
+        Walk a whole message box page by page, see SmartSchoolClient.iter_messages
+        """
+        offset = 0
+        previous_ids = None
+        while True:
+            messages = await self._list_messages(
+                message_list_command(box_type, box_id, offset=offset, limit=page_size)
+            )
+            message_ids = [message['id'] for message in messages]
+            if not messages or message_ids == previous_ids:
+                return
+            for message in messages:
+                yield MessageSummary.from_dict(message) if typed else message
+            if len(messages) < page_size:
+                return
+            previous_ids = message_ids
+            offset += len(messages)
+
+    async def _list_messages(self, command):
+        """
+        Send a message list command and parse the listed messages
+        """
+        self.api_logger.info("Requesting messages from API")
+        self.api_logger.debug("Sending request to get messages")
+        response = await self._request(
+            'POST',
+            '/?module=Messages&file=dispatcher',
+            headers={
+                'X-Requested-With': 'XMLHttpRequest',
+            },
+            data={'command': command}
+        )
+        if response.status == 200:
+            self.api_logger.info("Messages received")
+            return SmartSchoolClient.parse_message_response(await response.text())
+        self.api_logger.error("Could not get messages")
+        raise ApiException("Could not get messages")
+
+    async def get_message_by_id(self, message_id, typed: bool = False):
+        """
+        Get message by ID
+        """
+        self.api_logger.info("Requesting message from API")
+        self.api_logger.debug("Sending request to get message with ID %s", message_id)
+        response = await self._request(
+            'POST',
+            '/?module=Messages&file=dispatcher',
+            headers={
+                'X-Requested-With': 'XMLHttpRequest',
+            },
+            data={
+                'command': postboxes_command('show message', {
+                    'msgID': message_id,
+                    'boxType': 'inbox',
+                    'limitList': 'true',
+                })
+            }
+        )
+        if response.status == 200:
+            self.api_logger.info("Message received")
+            message = SmartSchoolClient.parse_single_message_response(await response.text())
+            return Message.from_dict(message) if typed else message
+        self.api_logger.error("Could not get message")
+        raise ApiException("Could not get message")
+
+    async def delete_message_by_id(self, message_id):
+        """
+        Delete message by ID
+        """
+        self.api_logger.info("Deleting message from API")
+        self.api_logger.debug("Sending request to delete message with ID %s", message_id)
+        response = await self._request(
+            'POST',
+            '/?module=Messages&file=dispatcher',
+            headers={
+                'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                'X-Requested-With': 'XMLHttpRequest',
+            },
+            data=urllib.parse.urlencode({
+                'command': postboxes_command('quick delete', {'msgID': message_id})
+            })
+        )
+        if response.status == 200:
+            self.api_logger.info("Message deleted with ID %s", message_id)
+            return True
+        self.api_logger.error("Could not delete message")
+        raise ApiException("Could not delete message")
+
+    async def get_courses(self):
+        """
+        Get courses
+        """
+        self.api_logger.info("Requesting courses from API")
+        self.api_logger.debug("Sending request to get courses")
+        response = await self._request(
+            'POST',
+            '/Topnav/getCourseConfig',
+            headers={
+                'Content-Type': 'application/json, text/javascript, */*;',
+                'X-Requested-With': 'XMLHttpRequest',
+            }
+        )
+        if response.status == 200:
+            self.api_logger.info("Courses received")
+            courses_json = json.loads(await response.text())
+            return courses_json['own']
+        self.api_logger.error("Could not get courses")
+        raise ApiException("Could not get courses")
+
+    async def get_school_courses(self):
+        """
+        WARNING: IN DEVELOPMENT
+        Get school courses
+        """
+        self.api_logger.info("Requesting school courses from API")
+        self.api_logger.debug("Sending request to get school courses")
+        response = await self._request(
+            'GET',
+            '/course-list/api/v1/courses',
+            headers={
+                'Accept': 'application/json',
+            }
+        )
+        if response.status == 200:
+            self.api_logger.info("School courses received")
+            return json.loads(await response.text())
+        self.api_logger.error("Could not get school courses")
+        raise ApiException("Could not get school courses")
+
+    async def get_results(self, page: int = 1, per_page: int = 50):
+        """
+        Get results
+        """
+        self.api_logger.info("Requesting results from API")
+        self.api_logger.debug("Sending request to get results")
+        response = await self._request(
+            'GET',
+            f'/results/api/v1/evaluations/?pageNumber={page}&itemsOnPage={per_page}',
+            headers={
+                'Content-Type': 'application/json',
+                'Accept': '*/*'
+            }
+        )
+        if response.status == 200:
+            self.api_logger.info("Results received")
+            return json.loads(await response.text())
+        self.api_logger.error("Could not get results")
+        return None
+
+    async def get_planner(self, from_date=None, to_date=None):
+        """
+        Get planner
+
+        Args:
+            from_date: from date (YYYY-MM-DD)
+            to_date: to date (YYYY-MM-DD)
+        """
+        if from_date is not None and not DATE_PATTERN.match(from_date):
+            raise ValueError("from_date must be in format YYYY-MM-DD")
+        if to_date is not None and not DATE_PATTERN.match(to_date):
+            raise ValueError("to_date must be in format YYYY-MM-DD")
+
+        if from_date is None:
+            from_date = datetime.date.today().strftime("%Y-%m-%d")
+        if to_date is None:
+            to_date = (
+                    datetime.datetime.strptime(from_date, "%Y-%m-%d")
+                    +
+                    datetime.timedelta(days=7)
+            ).strftime("%Y-%m-%d")
+
+        self.api_logger.info("Requesting planner from API")
+        self.api_logger.debug("Sending request to get planner")
+        response = await self._request(
+            'GET',
+            f"/planner/api/v1/planned-elements/user/{self.platform_id}{self.user_id}_0"
+            f"?from={from_date}&to={to_date}",
+            headers={
+                'Content-Type': 'application/json',
+                'Accept': '*/*'
+            }
+        )
+        if response.status == 200:
+            self.api_logger.info("Planner received")
+            return await response.json(content_type=None)
+        self.api_logger.error("Could not get planner")
+        return None
+
+    async def get_live_sessions(self):
+        """
+        Get live sessions
+        """
+        self.api_logger.info("Requesting live sessions from API")
+        self.api_logger.debug("Sending request to get live sessions")
+        response = await self._request(
+            'GET',
+            '/online-session/api/v1/meeting/'
+        )
+        if response.status == 200:
+            self.api_logger.info("Live sessions received")
+            return await response.json(content_type=None)
+        self.api_logger.error("Could not get live sessions")
+        return None
+
+    async def get_course_live_session(self, course_id):
+        """
+        Get course live sessions
+        """
+        self.api_logger.info("Requesting course live sessions from API")
+        self.api_logger.debug("Sending request to get course live sessions")
+        response = await self._request(
+            'GET',
+            f'/course/api/v1/video-call/{self.platform_id}/{course_id}'
+        )
+        if response.status == 200:
+            self.api_logger.info("Course live sessions received")
+            return await response.json(content_type=None)
+        self.api_logger.error("Could not get course live sessions")
+        return None
+
+    async def get_upload_zone_dir(self, course_id: int = None, dir_id: str = None):
+        """
+        Get upload zone dir
+        """
+        if course_id is None:
+            raise ValueError("course_id is required")
+        if dir_id is None:
+            dir_id = "0"
+
+        self.api_logger.info("Requesting upload zone dir from API")
+        self.api_logger.debug("Sending request to get upload zone dir")
+        response = await self._request(
+            'POST',
+            f'/?module=Uploadzone&file=tree&ssID={self.platform_id}&courseID={course_id}',
+            headers={
+                'Content-Type': 'application/x-www-form-urlencoded'
+            },
+            data="id=" + dir_id
+        )
+        if response.status == 200:
+            self.api_logger.info("Upload zone dir received")
+            return await response.json(content_type=None)
+        self.api_logger.error("Could not get upload zone dir")
+        return None
+
+    async def get_helpdesk_tickets_filters(self):
+        """
+        Get helpdesk tickets filter
+        """
+        self.api_logger.info("Requesting tickets filter from API")
+        self.api_logger.debug("Sending request to get tickets filter")
+        response = await self._request(
+            'GET',
+            '/helpdesk/api/v1/filters/',
+            headers={
+                'Accept': 'application/json'
+            }
+        )
+        if response.status == 200:
+            self.api_logger.info("Tickets filter received")
+            return await response.json(content_type=None)
+        self.api_logger.error("Could not get tickets filter")
+        return None
+
+    async def get_helpdesk_tickets_by_filter_id(self, filter_id):
+        """
+        Get helpdesk tickets by filter id
+        """
+        self.api_logger.info("Requesting tickets from API")
+        self.api_logger.debug("Sending request to get tickets")
+        response = await self._request(
+            'GET',
+            f'/helpdesk/api/v1/tickets/filter/{filter_id}',
+            headers={
+                'Accept': 'application/json'
+            }
+        )
+        if response.status == 200:
+            self.api_logger.info("Tickets received")
+            return await response.json(content_type=None)
+        self.api_logger.error("Could not get tickets")
+        return None
+
+    async def intradesk_get_directory(self, directory: str = ""):
+        """
+        Get intradesk files
+        """
+        self.api_logger.info("Requesting intradesk files from API")
+        self.api_logger.debug("Sending request to get intradesk files")
+        response = await self._request(
+            'GET',
+            f'/intradesk/api/v1/{self.platform_id}/directory-listing'
+            '/forTreeOnlyFolders' + (f'/{directory}' if directory else ''),
+            headers={
+                'Accept': 'application/json'
+            }
+        )
+        if response.status == 200:
+            self.api_logger.info("Intradesk folders received")
+            return await response.json(content_type=None)
+        self.api_logger.error("Could not get intradesk folders")
+        return None
@@ -0,0 +1,161 @@
+"""
+Content-addressed store for message attachments
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .ratelimit import TokenBucket
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AttachmentStore:
+    """
+    Stores attachments once per content, under objects/<sha256[:2]>/<sha256>
+
+    An index remembers which content each (domain, fileID) resolved to, so an
+    attachment that was already archived is not downloaded again. Attachments
+    with different fileIDs but identical content are downloaded, then
+    stored as a single file.
+
+    Args:
+        root: directory of the store
+
+    Usage:
+        with AttachmentStore("attachments") as store:
+            for message_id, attachment, path in store.archive(client, message_ids):
+                ...
+    """
+
+    def __init__(self, root: str = "attachments"):
+        self.root = root
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            os.path.join(root, 'index.sqlite3'), check_same_thread=False
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS attachments ('
+            'domain TEXT NOT NULL, '
+            'file_id TEXT NOT NULL, '
+            'digest TEXT NOT NULL, '
+            'name TEXT, '
+            'PRIMARY KEY (domain, file_id))'
+        )
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """
+        Close the index
+        """
+        self._connection.close()
+
+    def path_for(self, digest: str) -> str:
+        """
+        Path of the content with the given sha256 digest
+        """
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def lookup(self, domain: str, file_id) -> str:
+        """
+        Path of an already stored attachment, None if it is not in the store
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT digest FROM attachments WHERE domain = ? AND file_id = ?',
+                (domain, str(file_id))
+            ).fetchone()
+        if row is None or not os.path.exists(self.path_for(row[0])):
+            return None
+        return self.path_for(row[0])
+
+    def add_file(self, path: str) -> str:
+        """
+        Move a file into the store, return its path in the store
+        """
+        stored_path = self.path_for(_file_digest(path))
+        if os.path.exists(stored_path):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+            os.replace(path, stored_path)
+        return stored_path
+
+    def fetch(self, client, attachment: dict, bucket: TokenBucket = None) -> str:
+        """
+        Store an attachment from SmartSchoolClient.list_message_attachments,
+        downloading it only if it is not known yet
+
+        Returns:
+            path of the attachment in the store
+        """
+        file_id = attachment['fileID']
+        stored_path = self.lookup(client.domain, file_id)
+        if stored_path is not None:
+            return stored_path
+
+        # named after the attachment, so a failed download is resumed by the next fetch
+        download_path = os.path.join(
+            self.root, 'tmp',
+            hashlib.sha256(f'{client.domain}/{file_id}'.encode()).hexdigest()
+        )
+        client.download_message_attachment(file_id, download_path, bucket=bucket)
+        stored_path = self.add_file(download_path)
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO attachments VALUES (?, ?, ?, ?)',
+                (client.domain, str(file_id), os.path.basename(stored_path),
+                 attachment.get('name'))
+            )
+        return stored_path
+
+    def archive(self, client, message_ids, max_workers: int = 4, bandwidth_limit: float = None):
+        """
+        Store every attachment of the given messages concurrently
+
+        An attachment found in several messages is downloaded once.
+
+        Yields:
+            (message_id, attachment, path) as each attachment is stored
+        """
+        bucket = TokenBucket(bandwidth_limit) if bandwidth_limit else None
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            listings = {
+                executor.submit(client.list_message_attachments, message_id): message_id
+                for message_id in message_ids
+            }
+            # fileID -> download, download -> the (message_id, attachment) it stores
+            fetches = {}
+            downloads = {}
+            for future in as_completed(listings):
+                message_id = listings[future]
+                for attachment in future.result():
+                    file_id = str(attachment['fileID'])
+                    if file_id not in fetches:
+                        fetches[file_id] = executor.submit(self.fetch, client, attachment, bucket)
+                        downloads[fetches[file_id]] = []
+                    downloads[fetches[file_id]].append((message_id, attachment))
+            for future in as_completed(downloads):
+                path = future.result()
+                for message_id, attachment in downloads[future]:
+                    yield message_id, attachment, path
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,324 @@
+"""
+Response cache for read-only endpoints
+"""
+import datetime
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 300
+
+# endpoint -> time to live in seconds
+DEFAULT_TTLS = {
+    'get_courses': 3600,
+    'get_school_courses': 3600,
+    'get_helpdesk_tickets_filters': 3600,
+    'get_live_sessions': 300,
+    'intradesk_get_directory': 600,
+    # only cached while push invalidation is on, see cached(push_invalidated=True)
+    'list_messages': 60,
+    'get_results': 300,
+}
+
+MISSING = object()
+
+# endpoints cached with push_invalidated=True, filled by cached()
+PUSH_INVALIDATED_ENDPOINTS = set()
+
+
+class MemoryCache:
+    """
+    In-memory LRU cache backend with per-entry expiry
+
+    Values are returned as stored, callers should not mutate them.
+
+    Args:
+        maxsize: maximum number of entries, least recently used entries are evicted
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get a value, MISSING if absent or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        """
+        Store a value for ttl seconds
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, domain=None, user=None, endpoint=None):
+        """
+        Drop every entry matching the given domain, user and endpoint
+        """
+        with self._lock:
+            for key in [key for key in self._entries if _matches(key, domain, user, endpoint)]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache:
+    """
+    SQLite cache backend, survives restarts and can be shared between processes
+
+    Values must be JSON serialisable.
+
+    Args:
+        path: SQLite database path
+    """
+
+    def __init__(self, path: str = "smartschool_cache.sqlite3"):
+        import sqlite3  # pylint: disable=import-outside-toplevel
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'domain TEXT, user TEXT, endpoint TEXT, params TEXT, '
+            'value TEXT NOT NULL, expires_at REAL NOT NULL, '
+            'PRIMARY KEY (domain, user, endpoint, params))'
+        )
+        self._connection.commit()
+
+    def close(self):
+        """
+        Close the database
+        """
+        self._connection.close()
+
+    def get(self, key):
+        """
+        Get a value, MISSING if absent or expired
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value, expires_at FROM cache '
+                'WHERE domain = ? AND user = ? AND endpoint = ? AND params = ?',
+                key
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return MISSING
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl: float):
+        """
+        Store a value for ttl seconds
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)',
+                (*key, json.dumps(value), time.time() + ttl)
+            )
+
+    def invalidate(self, domain=None, user=None, endpoint=None):
+        """
+        Drop every entry matching the given domain, user and endpoint
+        """
+        conditions = {'domain': domain, 'user': user, 'endpoint': endpoint}
+        conditions = {column: value for column, value in conditions.items() if value is not None}
+        where = ' AND '.join(f'{column} = ?' for column in conditions) or '1'
+        with self._lock, self._connection:
+            self._connection.execute(f'DELETE FROM cache WHERE {where}', tuple(conditions.values()))
+
+
+def _matches(key, domain, user, endpoint):
+    key_domain, key_user, key_endpoint, _ = key
+    return ((domain is None or key_domain == domain)
+            and (user is None or key_user == user)
+            and (endpoint is None or key_endpoint == endpoint))
+
+
+class ResponseCache:
+    """
+    Cache of endpoint responses keyed by domain, user, endpoint and parameters
+
+    Args:
+        backend: MemoryCache (default) or DiskCache
+        ttls: endpoint -> time to live overrides, merged over DEFAULT_TTLS
+        default_ttl: time to live of endpoints without a configured ttl
+
+    Usage:
+        client = SmartSchoolClient(domain, cache=ResponseCache())
+        client.get_courses()  # network
+        client.get_courses()  # cache
+        client.cache.invalidate(endpoint='get_courses')
+        client.cache.stats()
+    """
+
+    def __init__(self, backend=None, ttls: dict = None, default_ttl: float = DEFAULT_TTL):
+        self.backend = backend if backend is not None else MemoryCache()
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._hits = {}
+        self._misses = {}
+
+    @staticmethod
+    def make_key(domain, user, endpoint, params=None):
+        """
+        Build the cache key of an endpoint call
+        """
+        return (str(domain), str(user), endpoint, json.dumps(params, sort_keys=True, default=str))
+
+    def _count(self, counters, endpoint):
+        with self._lock:
+            counters[endpoint] = counters.get(endpoint, 0) + 1
+
+    def get_or_fetch(self, domain, user, endpoint, params, fetch):
+        """
+        Return the cached value or call fetch() and cache its result
+
+        None results (failed requests) are not cached.
+        """
+        key = self.make_key(domain, user, endpoint, params)
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self._count(self._hits, endpoint)
+            return value
+        self._count(self._misses, endpoint)
+        value = fetch()
+        if value is not None:
+            self.backend.set(key, value, self.ttls.get(endpoint, self.default_ttl))
+        return value
+
+    def invalidate(self, domain=None, user=None, endpoint=None):
+        """
+        Drop cached responses, all of them when no filter is given
+        """
+        self.backend.invalidate(
+            domain=None if domain is None else str(domain),
+            user=None if user is None else str(user),
+            endpoint=endpoint
+        )
+
+    def stats(self):
+        """
+        Hit and miss counters, in total and per endpoint
+        """
+        with self._lock:
+            endpoints = {
+                endpoint: {
+                    'hits': self._hits.get(endpoint, 0),
+                    'misses': self._misses.get(endpoint, 0),
+                }
+                for endpoint in set(self._hits) | set(self._misses)
+            }
+        return {
+            'hits': sum(counters['hits'] for counters in endpoints.values()),
+            'misses': sum(counters['misses'] for counters in endpoints.values()),
+            'endpoints': endpoints,
+        }
+
+
+def cached(endpoint: str, push_invalidated: bool = False):
+    """
+    Cache the result of a SmartSchoolClient method in client.cache, if the client has one
+
+    Args:
+        endpoint: cache key and ttl name of the method
+        push_invalidated: only cache while client.enable_push_invalidation() is on,
+            for endpoints that change too often to be served stale otherwise
+    """
+    if push_invalidated:
+        PUSH_INVALIDATED_ENDPOINTS.add(endpoint)
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.cache is None or (push_invalidated and self.push_invalidations is None):
+                return method(self, *args, **kwargs)
+            return self.cache.get_or_fetch(
+                self.domain, self.user_id, endpoint, [args, kwargs],
+                lambda: method(self, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
+
+
+class PlannerCache:
+    """
+    Planned elements cached per account and per day
+
+    Freshness depends on the day: today changes often, past days hardly ever.
+
+    Args:
+        today_ttl: time to live of today, in seconds
+        past_ttl: time to live of past days, in seconds
+        future_ttl: time to live of future days, in seconds
+
+    Usage:
+        client = SmartSchoolClient(domain, planner_cache=PlannerCache())
+        client.get_planner("2024-03-04", "2024-03-10")  # fetches the week
+        client.get_planner("2024-03-06", "2024-03-13")  # only fetches 03-11 to 03-13
+    """
+
+    def __init__(self, today_ttl: float = 300, past_ttl: float = 86400,
+                 future_ttl: float = 3600):
+        self.today_ttl = today_ttl
+        self.past_ttl = past_ttl
+        self.future_ttl = future_ttl
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def ttl_for(self, day: datetime.date) -> float:
+        """
+        Time to live of a day
+        """
+        today = datetime.date.today()
+        if day == today:
+            return self.today_ttl
+        if day < today:
+            return self.past_ttl
+        return self.future_ttl
+
+    def get(self, account, day: datetime.date):
+        """
+        Planned elements of a day, None if the day is missing or expired
+        """
+        with self._lock:
+            entry = self._days.get((account, day))
+        if entry is None:
+            return None
+        elements, fetched_at = entry
+        if fetched_at + self.ttl_for(day) < time.monotonic():
+            return None
+        return elements
+
+    def store(self, account, day: datetime.date, elements: list):
+        """
+        Store the planned elements of a day
+        """
+        with self._lock:
+            self._days[(account, day)] = (elements, time.monotonic())
+
+    def invalidate(self, account=None, day: datetime.date = None):
+        """
+        Drop cached days, all of them when no filter is given
+        """
+        with self._lock:
+            for key in [key for key in self._days
+                        if (account is None or key[0] == account)
+                        and (day is None or key[1] == day)]:
+                del self._days[key]
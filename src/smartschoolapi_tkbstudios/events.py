@@ -0,0 +1,186 @@
+"""
+Typed Websocket events and handler registry
+"""
+import json
+from dataclasses import dataclass
+
+try:
+    import orjson
+except ImportError:  # optional, json is used instead
+    orjson = None
+
+PUBSUB_TEXT = 'pubsub message'
+
+
+def loads(data):
+    """
+    Decode a JSON frame, with orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+@dataclass(slots=True)
+class WebsocketEvent:
+    """
+    Websocket message without a more specific event class
+    """
+    type: str
+    raw: dict
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'WebsocketEvent':
+        """
+        Decode a Websocket message dict
+        """
+        return cls(type=data.get('type'), raw=data)
+
+
+@dataclass(slots=True)
+class AuthEvent(WebsocketEvent):
+    """
+    Answer to checkToken, request is "getToken" when the token was accepted
+    """
+    request: str = None
+    text: str = None
+
+    @property
+    def success(self) -> bool:
+        """
+        Whether the token was accepted
+        """
+        return self.request == 'getToken'
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'AuthEvent':
+        return cls(type=data.get('type'), raw=data, request=data.get('request'),
+                   text=data.get('text'))
+
+
+@dataclass(slots=True)
+class NotificationListStart(WebsocketEvent):
+    """
+    The server starts sending notifications
+    """
+
+
+@dataclass(slots=True)
+class NotificationConfigRequest(WebsocketEvent):
+    """
+    The server asks for the notification config (getNotificationConfig)
+    """
+
+
+@dataclass(slots=True)
+class Notification(WebsocketEvent):
+    """
+    Pubsub notification, e.g. a new message alert
+    """
+    text: str = None
+    alert_type: str = None
+    module: str = None
+    title: str = None
+    description: str = None
+    url: str = None
+    user_id: str = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Notification':
+        message = data.get('message')
+        if isinstance(message, (str, bytes)):
+            try:
+                message = loads(message)
+            except ValueError:
+                message = None
+        if not isinstance(message, dict):
+            message = {}
+        return cls(
+            type=data.get('type'),
+            raw=data,
+            text=data.get('text'),
+            alert_type=message.get('type'),
+            module=message.get('module'),
+            title=message.get('title'),
+            description=message.get('description'),
+            url=message.get('url'),
+            user_id=message.get('userID'),
+        )
+
+
+# message "type" -> event class, extended with register_event_type
+EVENT_TYPES = {
+    'auth': AuthEvent,
+    'notificationListStart': NotificationListStart,
+    'getNotificationConfig': NotificationConfigRequest,
+}
+
+
+def register_event_type(message_type: str, event_class):
+    """
+    Decode messages of message_type as event_class, a WebsocketEvent subclass
+    """
+    EVENT_TYPES[message_type] = event_class
+
+
+def decode_event(data) -> WebsocketEvent:
+    """
+    Decode a Websocket message (raw frame or dict) to its event class
+
+    Messages of an unregistered type are pubsub Notifications when their text
+    says so, WebsocketEvents otherwise.
+    """
+    if not isinstance(data, dict):
+        data = loads(data)
+    event_class = EVENT_TYPES.get(data.get('type'))
+    if event_class is None:
+        event_class = Notification if data.get('text') == PUBSUB_TEXT else WebsocketEvent
+    return event_class.from_dict(data)
+
+
+class EventRegistry:
+    """
+    Event class -> handlers, dispatching an event is one dict lookup
+
+    Usage:
+        @client.event_handlers.register(Notification)
+        def on_notification(event):
+            print(event.title, event.description)
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+    def register(self, event_class, handler=None):
+        """
+        Call handler(event) for every event of event_class, usable as a decorator
+        """
+        if handler is None:
+            return lambda function: self.register(event_class, function)
+        self._handlers[event_class] = (*self._handlers.get(event_class, ()), handler)
+        return handler
+
+    def unregister(self, event_class, handler):
+        """
+        Stop calling handler for event_class
+        """
+        handlers = tuple(registered for registered in self._handlers.get(event_class, ())
+                         if registered != handler)
+        if handlers:
+            self._handlers[event_class] = handlers
+        else:
+            self._handlers.pop(event_class, None)
+
+    def __contains__(self, event_class):
+        return event_class in self._handlers
+
+    def dispatch(self, event: WebsocketEvent) -> bool:
+        """
+        Call the handlers of the class of event, returns whether there were any
+        """
+        handlers = self._handlers.get(type(event))
+        if not handlers:
+            return False
+        for handler in handlers:
+            handler(event)
+        return True
@@ -0,0 +1,253 @@
+"""
+Notification Websockets of many accounts on one asyncio event loop
+"""
+import asyncio
+import inspect
+import time
+from dataclasses import asdict, dataclass
+
+import aiohttp
+
+from .events import AuthEvent, NotificationConfigRequest, decode_event, loads
+from .ratelimit import backoff_delay
+from .smartschool import (
+    WEBSOCKET_URL,
+    check_token_message,
+    set_config_message,
+    websocket_logger,
+)
+
+
+@dataclass(slots=True)
+class ConnectionHealth:
+    """
+    Health of the Websocket of one account
+    """
+    state: str = 'stopped'
+    connects: int = 0
+    gaps: int = 0
+    token_refreshes: int = 0
+    messages: int = 0
+    connected_since: float = None
+    last_message_at: float = None
+    last_error: str = None
+
+
+class _Connection:
+    __slots__ = ('account', 'token', 'handler', 'token_provider', 'health', 'task',
+                 'authenticated', 'token_refreshed')
+
+    def __init__(self, account, token, handler, token_provider):
+        self.account = account
+        self.token = token
+        self.handler = handler
+        self.token_provider = token_provider
+        self.health = ConnectionHealth()
+        self.task = None
+        self.authenticated = False
+        self.token_refreshed = False
+
+
+async def _call(function, *args):
+    """
+    Call a sync or async function; sync functions run in a thread so they cannot block the loop
+    """
+    if inspect.iscoroutinefunction(function):
+        return await function(*args)
+    return await asyncio.to_thread(function, *args)
+
+
+class NotificationHub:
+    """
+    Holds the notification Websockets of many accounts on one event loop
+
+    Every account runs the checkToken/setConfig handshake of
+    SmartSchoolClient.run_websocket on its own connection, reconnects with
+    jittered exponential backoff and refreshes its token through
+    token_provider when checkToken fails. Messages are routed to the
+    account's handler(account, message); a coroutine handler is awaited and
+    a sync handler runs in a thread, so a slow handler holds back that
+    account's stream only.
+
+    Args:
+        websocket_url: notification Websocket URL
+        heartbeat: seconds between pings, a missing pong drops the connection
+        min_backoff: first reconnect delay cap, in seconds
+        max_backoff: largest reconnect delay cap, in seconds
+        connector: aiohttp connector to use instead of creating an unlimited one
+
+    Usage:
+        async with NotificationHub() as hub:
+            for client in clients:
+                hub.add_account(client.user_id, client.user_token, handler,
+                                token_provider=client.get_token_from_api)
+            ...
+            print(hub.health())
+    """
+
+    def __init__(self, websocket_url: str = WEBSOCKET_URL, heartbeat: float = 30,
+                 min_backoff: float = 1, max_backoff: float = 60,
+                 connector: aiohttp.BaseConnector = None):
+        self.websocket_url = websocket_url
+        self.heartbeat = heartbeat
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._connector = connector
+        self._session = None
+        self._connections = {}
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def start(self):
+        """
+        Open the shared session and connect every account added so far
+        """
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                # every Websocket holds a connection, so the pool must not cap them
+                connector=self._connector or aiohttp.TCPConnector(limit=0),
+                connector_owner=self._connector is None
+            )
+        for connection in self._connections.values():
+            self._start_connection(connection)
+
+    async def close(self):
+        """
+        Disconnect every account and close the session
+        """
+        tasks = [connection.task for connection in self._connections.values()
+                 if connection.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for connection in self._connections.values():
+            connection.task = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _start_connection(self, connection):
+        if self._session is not None and connection.task is None:
+            connection.task = asyncio.get_running_loop().create_task(
+                self._run(connection), name=f"notifications-{connection.account}"
+            )
+
+    def add_account(self, account, token: str, handler, token_provider=None):
+        """
+        Listen to the notifications of an account, connecting right away if the hub is started
+
+        Args:
+            account: key of the account in this hub
+            token: Websocket token, from get_token_from_api()
+            handler: called with (account, message) for every message
+            token_provider: sync or async callable returning a fresh token,
+                e.g. client.get_token_from_api
+        """
+        if account in self._connections:
+            raise ValueError(f"account {account!r} is already in the hub")
+        connection = _Connection(account, token, handler, token_provider)
+        self._connections[account] = connection
+        self._start_connection(connection)
+
+    async def remove_account(self, account):
+        """
+        Disconnect an account and forget it
+        """
+        connection = self._connections.pop(account)
+        if connection.task is not None:
+            connection.task.cancel()
+            await asyncio.gather(connection.task, return_exceptions=True)
+
+    @property
+    def accounts(self) -> list:
+        """
+        Keys of the accounts in this hub
+        """
+        return list(self._connections)
+
+    def health(self, account=None) -> dict:
+        """
+        Health of the connection of an account, or of every account
+        """
+        if account is not None:
+            return asdict(self._connections[account].health)
+        return {account: asdict(connection.health)
+                for account, connection in self._connections.items()}
+
+    async def _run(self, connection):
+        health = connection.health
+        attempt = 0
+        try:
+            while True:
+                health.state = 'connecting'
+                connection.authenticated = False
+                connection.token_refreshed = False
+                connected_at = time.monotonic()
+                try:
+                    await self._listen(connection)
+                # anything but a cancellation, e.g. a token_provider network error, is retried
+                except Exception as error:  # pylint: disable=broad-exception-caught
+                    health.last_error = repr(error)
+                    websocket_logger.debug("Websocket of %s failed: %r", connection.account, error)
+                health.connected_since = None
+                if connection.authenticated:
+                    health.gaps += 1
+                    if time.monotonic() - connected_at > self.max_backoff:
+                        attempt = 0
+                health.state = 'backoff'
+                await asyncio.sleep(backoff_delay(attempt, self.min_backoff, self.max_backoff))
+                attempt += 1
+        finally:
+            health.state = 'stopped'
+            health.connected_since = None
+
+    async def _listen(self, connection):
+        async with self._session.ws_connect(self.websocket_url,
+                                            heartbeat=self.heartbeat) as ws:
+            connection.health.connects += 1
+            connection.health.state = 'authenticating'
+            await ws.send_str(check_token_message(connection.token))
+            async for message in ws:
+                if message.type == aiohttp.WSMsgType.TEXT:
+                    await self._on_message(connection, ws, loads(message.data))
+                elif message.type == aiohttp.WSMsgType.ERROR:
+                    connection.health.last_error = repr(ws.exception())
+                    break
+
+    async def _on_message(self, connection, ws, message_data):
+        health = connection.health
+        health.messages += 1
+        health.last_message_at = time.time()
+        event = decode_event(message_data)
+        if isinstance(event, AuthEvent) and event.success:
+            connection.authenticated = True
+            health.state = 'connected'
+            health.connected_since = time.time()
+        elif isinstance(event, AuthEvent):
+            await self._refresh_token(connection, ws)
+        elif isinstance(event, NotificationConfigRequest):
+            await ws.send_str(set_config_message())
+        try:
+            result = await _call(connection.handler, connection.account, message_data)
+            if inspect.isawaitable(result):
+                await result
+        except Exception:  # pylint: disable=broad-exception-caught
+            websocket_logger.exception("Notification handler of %s failed", connection.account)
+
+    async def _refresh_token(self, connection, ws):
+        """
+        Get a new token after checkToken failed and authenticate again, once per connection
+        """
+        if connection.token_provider is None or connection.token_refreshed:
+            connection.health.last_error = "authentication failed"
+            await ws.close()
+            return
+        connection.token_refreshed = True
+        connection.token = await _call(connection.token_provider)
+        connection.health.token_refreshes += 1
+        await ws.send_str(check_token_message(connection.token))
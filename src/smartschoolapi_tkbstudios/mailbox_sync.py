@@ -0,0 +1,167 @@
+"""
+Incremental mailbox synchronisation backed by a local SQLite store
+"""
+import json
+import sqlite3
+import threading
+from typing import NamedTuple
+
+TRACKED_FIELDS = ('unread', 'status', 'label')
+
+
+class MailboxChanges(NamedTuple):
+    """
+    Changes found by a MailboxSync.sync() call
+
+    Attributes:
+        added: full messages that were not known yet
+        updated: full messages whose unread/status/label changed
+        deleted: IDs of messages that are no longer listed
+    """
+    added: list
+    updated: list
+    deleted: list
+
+    def __bool__(self):
+        return bool(self.added or self.updated or self.deleted)
+
+
+class MailboxSync:
+    """
+    Keeps a local copy of a mailbox and only fetches what changed
+
+    Every sync() lists the whole inbox, compares it with the known messages
+    and fetches the body of new or changed messages only.
+
+    Args:
+        client: authenticated SmartSchoolClient
+        database: SQLite database path, one database can hold several accounts
+
+    Usage:
+        with MailboxSync(client, "mailbox.sqlite3") as mailbox:
+            changes = mailbox.sync()
+            for message in changes.added:
+                ...
+    """
+
+    def __init__(self, client, database: str = "mailbox.sqlite3"):
+        self.client = client
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(database, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS messages ('
+            'account TEXT NOT NULL, '
+            'id TEXT NOT NULL, '
+            'unread TEXT, '
+            'status TEXT, '
+            'label TEXT, '
+            'summary TEXT NOT NULL, '
+            'body TEXT, '
+            'PRIMARY KEY (account, id))'
+        )
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """
+        Close the database
+        """
+        self._connection.close()
+
+    @property
+    def account(self):
+        """
+        Key of the synchronised account in the store
+        """
+        return f'{self.client.domain}/{self.client.user_id}'
+
+    def _known_messages(self):
+        rows = self._connection.execute(
+            'SELECT id, unread, status, label FROM messages WHERE account = ?',
+            (self.account,)
+        )
+        return {row[0]: row[1:] for row in rows}
+
+    def sync(self, max_workers: int = 5, rate_limit: float = None) -> MailboxChanges:
+        """
+        List the mailbox, fetch new and changed messages and update the store
+
+        Every fetched message is stored as soon as it is received, so when a
+        fetch fails the messages received before it are kept and the others
+        are fetched again by the next sync().
+
+        Args:
+            max_workers: maximum number of message bodies fetched at once
+            rate_limit: maximum requests per second, see get_messages_by_ids
+        """
+        # the whole box, list_messages() only returns its first page
+        listing = {message['id']: message for message in self.client.iter_messages()}
+        with self._lock:
+            known = self._known_messages()
+
+        new_ids = [message_id for message_id in listing if message_id not in known]
+        changed_ids = [
+            message_id for message_id, fields in known.items()
+            if message_id in listing
+            and tuple(listing[message_id][field] for field in TRACKED_FIELDS) != fields
+        ]
+        deleted_ids = [message_id for message_id in known if message_id not in listing]
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'DELETE FROM messages WHERE account = ? AND id = ?',
+                [(self.account, message_id) for message_id in deleted_ids]
+            )
+
+        bodies = {}
+        if new_ids or changed_ids:
+            for message in self.client.get_messages_by_ids(
+                    new_ids + changed_ids, max_workers=max_workers, rate_limit=rate_limit
+            ):
+                message_id = message['id']
+                bodies[message_id] = message
+                with self._lock, self._connection:
+                    self._connection.execute(
+                        'INSERT OR REPLACE INTO messages '
+                        '(account, id, unread, status, label, summary, body) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (
+                            self.account, message_id,
+                            *(listing[message_id][field] for field in TRACKED_FIELDS),
+                            json.dumps(listing[message_id]), json.dumps(message)
+                        )
+                    )
+
+        return MailboxChanges(
+            added=[bodies[message_id] for message_id in new_ids if message_id in bodies],
+            updated=[bodies[message_id] for message_id in changed_ids if message_id in bodies],
+            deleted=deleted_ids
+        )
+
+    def get_message(self, message_id):
+        """
+        Get a cached message by ID, None if it is not in the store
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT body FROM messages WHERE account = ? AND id = ?',
+                (self.account, str(message_id))
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def list_messages(self):
+        """
+        Get the cached message list, as returned by SmartSchoolClient.list_messages
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT summary FROM messages WHERE account = ?', (self.account,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
@@ -0,0 +1,335 @@
+"""
+Many SmartSchool accounts sharing one connection pool
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from .ratelimit import TokenBucket
+from .smartschool import DEFAULT_TIMEOUT, SmartSchoolClient, make_adapter
+
+
+class RequestStats:
+    """
+    Thread-safe latency and error counters of one account
+    """
+
+    __slots__ = ('requests', 'errors', 'total_latency', 'max_latency', '_lock')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, error: bool = False):
+        """
+        Record one request, latency in seconds
+        """
+        with self._lock:
+            self.requests += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if error:
+                self.errors += 1
+
+    def as_dict(self) -> dict:
+        """
+        Snapshot of the counters
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'error_rate': self.errors / self.requests if self.requests else 0.0,
+                'avg_latency': self.total_latency / self.requests if self.requests else 0.0,
+                'max_latency': self.max_latency,
+            }
+
+
+# set by ClientManager._run when the dispatcher already took a rate limit token for the task
+_prepaid = threading.local()
+
+
+class _TaskLimiter:
+    """
+    Rate limiter of a managed client: the first request of a task uses the
+    token taken when the task was dispatched, later ones wait on the bucket
+    """
+
+    __slots__ = ('bucket',)
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+
+    def acquire(self):
+        """
+        Take a token, blocking until one is available
+        """
+        if getattr(_prepaid, 'token', False):
+            _prepaid.token = False
+            return
+        self.bucket.acquire()
+
+
+class ClientManager:
+    """
+    Hosts many account contexts on one shared connection pool
+
+    Every account gets its own SmartSchoolClient (and cookie jar), but all of
+    them send their requests through a single HTTPAdapter. Work submitted for
+    the accounts is run by one worker pool, taking one task per account in turn
+    so a busy account cannot starve the others. A task is only handed to a
+    worker once its domain's token bucket has a token, so throttled domains
+    do not hold the workers that other domains need; further requests of a
+    task making several wait on the bucket.
+
+    Args:
+        max_workers: number of requests running at the same time
+        rate_limits: domain -> requests per second
+        default_rate_limit: requests per second of domains missing from rate_limits,
+            None for no limit
+        pool_connections: number of hosts to keep pools for
+        pool_maxsize: connections kept per host
+        max_retries: retries of failed connections and 502/503/504 responses
+        timeout: default request timeout, in seconds
+
+    Usage:
+        with ClientManager(rate_limits={"school.smartschool.be": 5}) as manager:
+            manager.add_account("alice", "school.smartschool.be", phpsessid, pid, user_id)
+            manager.add_account("bob", "school.smartschool.be", phpsessid, pid, user_id)
+            for account, future in manager.map("get_courses"):
+                print(account, future.result())
+            print(manager.stats())
+    """
+
+    def __init__(self, max_workers: int = 16, rate_limits: dict = None,
+                 default_rate_limit: float = None, pool_connections: int = 10,
+                 pool_maxsize: int = 16, max_retries: int = 3,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.max_workers = max_workers
+        self.rate_limits = dict(rate_limits or {})
+        self.default_rate_limit = default_rate_limit
+        self.timeout = timeout
+        self.adapter = make_adapter(pool_connections, pool_maxsize, max_retries=max_retries)
+        self._clients = {}
+        self._stats = {}
+        self._buckets = {}
+        # account -> token bucket of its domain, for the accounts of rate limited domains
+        self._account_buckets = {}
+        self._queues = {}
+        # accounts with queued tasks, in the order they get their next turn
+        self._ready = OrderedDict()
+        self._running = 0
+        self._wakeup = None
+        self._wakeup_at = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """
+        Cancel queued tasks, wait for running ones and close the connection pool
+        """
+        with self._lock:
+            queues = list(self._queues.values())
+            self._ready.clear()
+            if self._wakeup is not None:
+                self._wakeup.cancel()
+                self._wakeup = None
+        for queue in queues:
+            while queue:
+                queue.popleft()[0].cancel()
+        self._executor.shutdown(wait=True)
+        self.adapter.close()
+
+    def _bucket_for(self, domain):
+        rate = self.rate_limits.get(domain, self.default_rate_limit)
+        if rate is None:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(domain)
+            if bucket is None:
+                bucket = TokenBucket(rate)
+                self._buckets[domain] = bucket
+            return bucket
+
+    def add_account(self, account, domain: str, phpsessid: str, pid: str,
+                    user_id=None, platform_id=None, **client_kwargs) -> SmartSchoolClient:
+        """
+        Create the client of an account
+
+        Args:
+            account: key of the account in this manager
+            domain: SmartSchool domain of the account
+            phpsessid: PHPSESSID cookie
+            pid: pid cookie
+            user_id: SmartSchool user id
+            platform_id: SmartSchool platform id
+            client_kwargs: extra SmartSchoolClient arguments, e.g. cache
+        """
+        client_kwargs.setdefault('timeout', self.timeout)
+        client = SmartSchoolClient(domain, adapter=self.adapter, **client_kwargs)
+        client.phpsessid = phpsessid
+        client.pid = pid
+        client.user_id = user_id
+        client.platform_id = platform_id
+        bucket = self._bucket_for(domain)
+        client.rate_limiter = _TaskLimiter(bucket) if bucket is not None else None
+        client.stats = self._stats.setdefault(account, RequestStats())
+        with self._lock:
+            self._clients[account] = client
+            if bucket is not None:
+                self._account_buckets[account] = bucket
+        return client
+
+    def remove_account(self, account):
+        """
+        Drop an account, its queued tasks are cancelled
+        """
+        with self._lock:
+            client = self._clients.pop(account)
+            self._stats.pop(account, None)
+            self._account_buckets.pop(account, None)
+            self._ready.pop(account, None)
+            queue = self._queues.pop(account, deque())
+        while queue:
+            queue.popleft()[0].cancel()
+        # closing the session would close the shared adapter
+        client.session.cookies.clear()
+
+    def client(self, account) -> SmartSchoolClient:
+        """
+        Client of an account
+        """
+        return self._clients[account]
+
+    @property
+    def accounts(self) -> list:
+        """
+        Keys of the managed accounts
+        """
+        return list(self._clients)
+
+    def submit(self, account, method: str, *args, **kwargs) -> Future:
+        """
+        Queue a call of a client method for an account
+
+        Example:
+            future = manager.submit("alice", "get_results")
+        """
+        function = getattr(self._clients[account], method)
+        future = Future()
+        with self._lock:
+            self._queues.setdefault(account, deque()).append((future, function, args, kwargs))
+            if account not in self._ready:
+                self._ready[account] = None
+        self._dispatch()
+        return future
+
+    def map(self, method: str, *args, accounts=None, **kwargs):
+        """
+        Call a client method for every account (or the given accounts)
+
+        Yields:
+            (account, future) as each call completes
+        """
+        futures = {
+            self.submit(account, method, *args, **kwargs): account
+            for account in (self.accounts if accounts is None else accounts)
+        }
+        for future in as_completed(futures):
+            yield futures[future], future
+
+    def _dispatch(self):
+        """
+        Hand queued tasks to the worker pool, one account at a time
+        """
+        while True:
+            with self._lock:
+                if self._running >= self.max_workers or not self._ready:
+                    return
+                task = self._next_task()
+                if task is None:
+                    return
+                self._running += 1
+            self._executor.submit(self._run, *task)
+
+    def _next_task(self):
+        """
+        Take the next task of the first ready account whose domain has a rate limit token
+
+        Accounts waiting for a token keep their turn. When no account can
+        run, a timer dispatches again once the first token is available.
+        """
+        while self._ready:
+            wait = None
+            throttled = set()
+            for account in list(self._ready):
+                queue = self._queues[account]
+                bucket = self._account_buckets.get(account)
+                if not queue[0][0].cancelled() and bucket is not None:
+                    if bucket in throttled:
+                        continue
+                    bucket_wait = bucket.try_acquire()
+                    if bucket_wait:
+                        throttled.add(bucket)
+                        wait = bucket_wait if wait is None else min(wait, bucket_wait)
+                        continue
+                del self._ready[account]
+                future, *task = queue.popleft()
+                if queue:
+                    self._ready[account] = None
+                else:
+                    del self._queues[account]
+                if future.set_running_or_notify_cancel():
+                    return future, bucket is not None, *task
+                break  # a cancelled task was dropped, scan the accounts again
+            else:
+                if wait is not None:
+                    self._wake_after(wait)
+                return None
+        return None
+
+    def _wake_after(self, wait):
+        wakeup_at = time.monotonic() + wait
+        if self._wakeup is not None:
+            if self._wakeup_at <= wakeup_at:
+                return
+            self._wakeup.cancel()
+        self._wakeup_at = wakeup_at
+        self._wakeup = threading.Timer(wait, self._on_wakeup)
+        self._wakeup.daemon = True
+        self._wakeup.start()
+
+    def _on_wakeup(self):
+        with self._lock:
+            self._wakeup = None
+        self._dispatch()
+
+    def _run(self, future, prepaid, function, args, kwargs):
+        _prepaid.token = prepaid
+        try:
+            future.set_result(function(*args, **kwargs))
+        except BaseException as error:  # pylint: disable=broad-exception-caught
+            future.set_exception(error)
+        finally:
+            _prepaid.token = False
+            with self._lock:
+                self._running -= 1
+            self._dispatch()
+
+    def stats(self, account=None) -> dict:
+        """
+        Request latency and error counters of an account, or of every account
+        """
+        if account is not None:
+            return self._stats[account].as_dict()
+        return {account: stats.as_dict() for account, stats in list(self._stats.items())}
@@ -0,0 +1,209 @@
+"""
+Typed message records
+"""
+import datetime
+from dataclasses import dataclass
+
+
+def _to_int(value):
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def _to_bool(value):
+    if value is None or value == '':
+        return None
+    return value not in ('0', 'false')
+
+
+def _to_datetime(value):
+    """
+    Decode an ISO date, dates in another format are kept as the original string
+    """
+    if value is None or value == '':
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return value
+
+
+def _from_int(value):
+    return None if value is None else str(value)
+
+
+def _from_bool(value):
+    if value is None:
+        return None
+    return '1' if value else '0'
+
+
+def _from_datetime(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+@dataclass(slots=True)
+class MessageSummary:
+    """
+    Message as listed by a "message list" command
+    """
+    id: int
+    sender: str
+    from_image: str
+    subject: str
+    date: datetime.datetime
+    status: int
+    attachment: int
+    unread: bool
+    label: int
+    deleted: bool
+    allow_reply: bool
+    allow_reply_enabled: bool
+    has_reply: bool
+    has_forward: bool
+    real_box: str
+    send_date: datetime.datetime
+
+    @classmethod
+    def from_dict(cls, message: dict) -> 'MessageSummary':
+        """
+        Decode a message dict from SmartSchoolClient.parse_message_response
+        """
+        return cls(
+            id=_to_int(message['id']),
+            sender=message['from'],
+            from_image=message['from_image'],
+            subject=message['subject'],
+            date=_to_datetime(message['date']),
+            status=_to_int(message['status']),
+            attachment=_to_int(message['attachment']),
+            unread=_to_bool(message['unread']),
+            label=_to_int(message['label']),
+            deleted=_to_bool(message['deleted']),
+            allow_reply=_to_bool(message['allow_reply']),
+            allow_reply_enabled=_to_bool(message['allow_reply_enabled']),
+            has_reply=_to_bool(message['has_reply']),
+            has_forward=_to_bool(message['has_forward']),
+            real_box=message['real_box'],
+            send_date=_to_datetime(message['send_date']),
+        )
+
+    def to_dict(self) -> dict:
+        """
+        Encode back to the dict returned by SmartSchoolClient.parse_message_response
+        """
+        return {
+            'id': _from_int(self.id),
+            'from': self.sender,
+            'from_image': self.from_image,
+            'subject': self.subject,
+            'date': _from_datetime(self.date),
+            'status': _from_int(self.status),
+            'attachment': _from_int(self.attachment),
+            'unread': _from_bool(self.unread),
+            'label': _from_int(self.label),
+            'deleted': _from_bool(self.deleted),
+            'allow_reply': _from_bool(self.allow_reply),
+            'allow_reply_enabled': _from_bool(self.allow_reply_enabled),
+            'has_reply': _from_bool(self.has_reply),
+            'has_forward': _from_bool(self.has_forward),
+            'real_box': self.real_box,
+            'send_date': _from_datetime(self.send_date),
+        }
+
+
+@dataclass(slots=True)
+class Message:
+    """
+    Full message as returned by a "show message" command
+    """
+    id: int
+    sender: str
+    to: str
+    subject: str
+    date: datetime.datetime
+    body: str
+    status: int
+    attachment: int
+    unread: bool
+    label: int
+    receivers: tuple
+    cc_receivers: tuple
+    bcc_receivers: tuple
+    sender_picture: str
+    marked_in_lvs: bool
+    from_team: int
+    total_nr_other_to_receivers: int
+    total_nr_other_cc_receivers: int
+    total_nr_other_bcc_receivers: int
+    can_reply: bool
+    has_reply: bool
+    has_forward: bool
+    send_date: datetime.datetime
+
+    @classmethod
+    def from_dict(cls, message: dict) -> 'Message':
+        """
+        Decode a message dict from SmartSchoolClient.parse_single_message_response
+        """
+        return cls(
+            id=_to_int(message['id']),
+            sender=message['from'],
+            to=message['to'],
+            subject=message['subject'],
+            date=_to_datetime(message['date']),
+            body=message['body'],
+            status=_to_int(message['status']),
+            attachment=_to_int(message['attachment']),
+            unread=_to_bool(message['unread']),
+            label=_to_int(message['label']),
+            receivers=tuple(message['receivers']),
+            cc_receivers=tuple(message['ccreceivers']),
+            bcc_receivers=tuple(message['bccreceivers']),
+            sender_picture=message['senderPicture'],
+            marked_in_lvs=_to_bool(message['markedInLVS']),
+            from_team=_to_int(message['fromTeam']),
+            total_nr_other_to_receivers=_to_int(message['totalNrOtherToReciviers']),
+            total_nr_other_cc_receivers=_to_int(message['totalnrOtherCcReceivers']),
+            total_nr_other_bcc_receivers=_to_int(message['totalnrOtherBccReceivers']),
+            can_reply=_to_bool(message['canReply']),
+            has_reply=_to_bool(message['hasReply']),
+            has_forward=_to_bool(message['hasForward']),
+            send_date=_to_datetime(message['sendDate']),
+        )
+
+    def to_dict(self) -> dict:
+        """
+        Encode back to the dict returned by SmartSchoolClient.parse_single_message_response
+        """
+        return {
+            'id': _from_int(self.id),
+            'from': self.sender,
+            'to': self.to,
+            'subject': self.subject,
+            'date': _from_datetime(self.date),
+            'body': self.body,
+            'status': _from_int(self.status),
+            'attachment': _from_int(self.attachment),
+            'unread': _from_bool(self.unread),
+            'label': _from_int(self.label),
+            'receivers': list(self.receivers),
+            'ccreceivers': list(self.cc_receivers),
+            'bccreceivers': list(self.bcc_receivers),
+            'senderPicture': self.sender_picture,
+            'markedInLVS': _from_bool(self.marked_in_lvs),
+            'fromTeam': _from_int(self.from_team),
+            'totalNrOtherToReciviers': _from_int(self.total_nr_other_to_receivers),
+            'totalnrOtherCcReceivers': _from_int(self.total_nr_other_cc_receivers),
+            'totalnrOtherBccReceivers': _from_int(self.total_nr_other_bcc_receivers),
+            'canReply': _from_bool(self.can_reply),
+            'hasReply': _from_bool(self.has_reply),
+            'hasForward': _from_bool(self.has_forward),
+            'sendDate': _from_datetime(self.send_date),
+        }
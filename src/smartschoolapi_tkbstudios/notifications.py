@@ -0,0 +1,266 @@
+"""
+Bounded queues decoupling Websocket receive from notification processing
+"""
+import itertools
+import json
+import queue
+import threading
+from collections import OrderedDict
+
+# overflow policies of a full NotificationQueue
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+COALESCE = 'coalesce'
+OVERFLOW_POLICIES = (DROP_OLDEST, BLOCK, COALESCE)
+
+
+def notification_key(event: dict):
+    """
+    Coalescing key of a Websocket event: its type, and the module of pubsub notifications
+
+    Two queued "new message" notifications carry the same key, so a full
+    coalescing queue only keeps the latest.
+    """
+    message = event.get('message')
+    if isinstance(message, str):
+        try:
+            message = json.loads(message)
+        except ValueError:
+            message = None
+    module = message.get('module') if isinstance(message, dict) else None
+    return event.get('type'), event.get('text'), module
+
+
+class NotificationQueue:
+    """
+    Thread-safe bounded queue of Websocket events, iterable with for and async for
+
+    When the queue is full, put() applies the overflow policy:
+        DROP_OLDEST: the oldest queued event is discarded
+        BLOCK: put() waits for room, pushing back on the Websocket receive thread
+        COALESCE: an event replaces the queued event with the same key (keeping its
+            place in line); with no such event the oldest one is discarded
+
+    Args:
+        maxsize: maximum number of queued events
+        overflow: DROP_OLDEST, BLOCK or COALESCE
+        key: coalescing key of an event, see notification_key
+
+    Usage:
+        with client.notifications() as events:
+            for event in events:
+                ...
+
+        async with client.notifications() as events:
+            async for event in events:
+                ...
+    """
+
+    def __init__(self, maxsize: int = 1000, overflow: str = DROP_OLDEST,
+                 key=notification_key):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.key = key
+        self.dropped = 0
+        self.coalesced = 0
+        self.on_close = None
+        self._events = OrderedDict()
+        # coalescing key -> position in _events of the latest queued event with that key
+        self._latest = {}
+        self._counter = itertools.count()
+        self._closed = False
+        self.error = None
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._waiters = []
+
+    def __len__(self):
+        return len(self._events)
+
+    @property
+    def closed(self) -> bool:
+        """
+        Whether close() was called
+        """
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        self.close()
+
+    def close(self, error: BaseException = None):
+        """
+        Stop accepting events; consumers get the queued ones, then iteration ends
+
+        Args:
+            error: why the stream ended, raised to consumers once the queue is drained
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self.error = error
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+            self._wake_waiters()
+        if self.on_close is not None:
+            self.on_close(self)
+
+    def _wake_waiters(self):
+        for loop, waiter in self._waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+        self._waiters.clear()
+
+    def put(self, event: dict) -> bool:
+        """
+        Queue an event, returns False if the queue is closed
+        """
+        coalescing_key = self.key(event) if self.overflow == COALESCE else None
+        with self._lock:
+            if self._closed:
+                return False
+            if len(self._events) >= self.maxsize:
+                if self.overflow == BLOCK:
+                    while len(self._events) >= self.maxsize and not self._closed:
+                        self._not_full.wait()
+                    if self._closed:
+                        return False
+                elif coalescing_key is not None and coalescing_key in self._latest:
+                    self._events[self._latest[coalescing_key]] = (coalescing_key, event)
+                    self.coalesced += 1
+                    return True
+                else:
+                    self._pop()
+                    self.dropped += 1
+            position = next(self._counter)
+            self._events[position] = (coalescing_key, event)
+            if coalescing_key is not None:
+                self._latest[coalescing_key] = position
+            self._not_empty.notify()
+            self._wake_waiters()
+        return True
+
+    def _pop(self):
+        position, (coalescing_key, event) = self._events.popitem(last=False)
+        if self._latest.get(coalescing_key) == position:
+            del self._latest[coalescing_key]
+        self._not_full.notify()
+        return event
+
+    def get(self, timeout: float = None):
+        """
+        Wait for the next event, None once the queue is closed and drained
+
+        Raises:
+            queue.Empty: no event arrived within timeout seconds
+            Exception: the error the queue was closed with, once it is drained
+        """
+        with self._lock:
+            if not self._not_empty.wait_for(lambda: self._events or self._closed, timeout):
+                raise queue.Empty
+            if self._events:
+                return self._pop()
+        if self.error is not None:
+            raise self.error
+        return None
+
+    async def get_async(self):
+        """
+        Wait for the next event without blocking the event loop, None once the
+        queue is closed and drained
+
+        Raises:
+            Exception: the error the queue was closed with, once it is drained
+        """
+        import asyncio  # pylint: disable=import-outside-toplevel
+        while True:
+            with self._lock:
+                if self._events:
+                    return self._pop()
+                if self._closed:
+                    break
+                loop = asyncio.get_running_loop()
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            await waiter
+        if self.error is not None:
+            raise self.error
+        return None
+
+    def __iter__(self):
+        while (event := self.get()) is not None:
+            yield event
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.get_async()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class CallbackDispatcher:
+    """
+    Worker threads calling callback for every event of a NotificationQueue
+
+    Args:
+        events: queue to consume
+        callback: called with each event, exceptions are passed to logger
+        workers: number of worker threads
+        logger: logger for callback errors
+    """
+
+    def __init__(self, events: NotificationQueue, callback, workers: int, logger):
+        self.events = events
+        self.callback = callback
+        self.logger = logger
+        self._threads = [
+            threading.Thread(target=self._work, name=f"notification-callback-{index}",
+                             daemon=True)
+            for index in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self):
+        while True:
+            try:
+                event = self.events.get()
+            except Exception:  # pylint: disable=broad-exception-caught
+                return  # the stream failed, the Websocket thread logged why
+            if event is None:
+                return
+            try:
+                self.callback(event)
+            except Exception:  # pylint: disable=broad-exception-caught
+                self.logger.exception("Notification callback failed")
+
+    def close(self, wait: bool = True):
+        """
+        Close the queue, letting the workers finish the queued events
+        """
+        self.events.close()
+        if wait:
+            for thread in self._threads:
+                if thread is not threading.current_thread():
+                    thread.join()
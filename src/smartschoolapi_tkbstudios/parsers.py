@@ -0,0 +1,109 @@
+"""
+Streaming parsers for postboxes dispatcher responses
+"""
+# listing child tag -> message key
+MESSAGE_SUMMARY_FIELDS = {
+    'id': 'id',
+    'from': 'from',
+    'fromImage': 'from_image',
+    'subject': 'subject',
+    'date': 'date',
+    'status': 'status',
+    'attachment': 'attachment',
+    'unread': 'unread',
+    'label': 'label',
+    'deleted': 'deleted',
+    'allowreply': 'allow_reply',
+    'allowreplyenabled': 'allow_reply_enabled',
+    'hasreply': 'has_reply',
+    'hasForward': 'has_forward',
+    'realBox': 'real_box',
+    'sendDate': 'send_date',
+}
+
+MESSAGE_FIELDS = (
+    'id', 'from', 'to', 'subject', 'date', 'body', 'status', 'attachment', 'unread',
+    'label', 'receivers', 'ccreceivers', 'bccreceivers', 'senderPicture', 'markedInLVS',
+    'fromTeam', 'totalNrOtherToReciviers', 'totalnrOtherCcReceivers',
+    'totalnrOtherBccReceivers', 'canReply', 'hasReply', 'hasForward', 'sendDate',
+)
+
+MESSAGE_RECEIVER_FIELDS = ('receivers', 'ccreceivers', 'bccreceivers')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _chunks(source):
+    """
+    Yield chunks of source, a file-like object or an iterable of str/bytes
+    chunks (e.g. response.iter_content())
+    """
+    if hasattr(source, 'read'):
+        while chunk := source.read(CHUNK_SIZE):
+            yield chunk
+    else:
+        yield from source
+
+
+def iter_elements(source, tag):
+    """
+    Incrementally parse source and yield every complete element named tag
+
+    Streamed sources are fed to a pull parser and each element is cleared once
+    the caller moves on, so memory stays bounded by one element instead of the
+    whole document. Documents already in memory are parsed in one go, which
+    is cheaper than going through parser events.
+    """
+    from xml.etree import ElementTree  # pylint: disable=import-outside-toplevel
+    if isinstance(source, (str, bytes)):
+        yield from ElementTree.fromstring(source).iter(tag)
+        return
+    parser = ElementTree.XMLPullParser(events=('end',))
+    for chunk in _chunks(source):
+        parser.feed(chunk)
+        for _, elem in parser.read_events():
+            if elem.tag == tag:
+                yield elem
+                elem.clear()
+    parser.close()
+    for _, elem in parser.read_events():
+        if elem.tag == tag:
+            yield elem
+            elem.clear()
+
+
+def iter_message_summaries(source):
+    """
+    Yield message dicts of a "message list" response, one pass over each message
+    """
+    for elem in iter_elements(source, 'message'):
+        message = dict.fromkeys(MESSAGE_SUMMARY_FIELDS.values())
+        for child in elem:
+            key = MESSAGE_SUMMARY_FIELDS.get(child.tag)
+            if key is not None:
+                message[key] = child.text
+        yield message
+
+
+def parse_message(source):
+    """
+    Parse the message of a "show message" response, None if there is none
+    """
+    for elem in iter_elements(source, 'message'):
+        message = {field: [] if field in MESSAGE_RECEIVER_FIELDS else None
+                   for field in MESSAGE_FIELDS}
+        for child in elem:
+            if child.tag in MESSAGE_RECEIVER_FIELDS:
+                message[child.tag] = [receiver.text for receiver in child]
+            elif child.tag in message:
+                message[child.tag] = child.text
+        return message
+    return None
+
+
+def iter_attachments(source):
+    """
+    Yield attachment dicts of an "attachment list" response
+    """
+    for elem in iter_elements(source, 'attachment'):
+        yield {child.tag: child.text for child in elem}
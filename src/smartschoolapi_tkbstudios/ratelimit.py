@@ -0,0 +1,99 @@
+"""
+Rate limiting helpers
+"""
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Tokens are reserved in call order; a caller that overdraws the bucket
+    sleeps until the debt is refilled, so requests larger than the capacity
+    (e.g. a big chunk of bytes) still work.
+
+    Args:
+        rate: tokens added per second
+        capacity: maximum burst size, defaults to rate (at least 1)
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, tokens):
+        """
+        Take tokens from the bucket and return how long to wait for them
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens from the bucket if they are available, without waiting
+
+        Returns:
+            0 when the tokens were taken, else the seconds until they will be available
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1):
+        """
+        Take tokens from the bucket, blocking until they are available
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+
+_domain_buckets = {}
+_domain_buckets_lock = threading.Lock()
+
+
+def get_domain_bucket(domain: str, rate: float, capacity: float = None) -> TokenBucket:
+    """
+    Get the token bucket shared by every client talking to domain
+
+    The bucket is created on first use; later calls update its rate and capacity.
+    """
+    with _domain_buckets_lock:
+        bucket = _domain_buckets.get(domain)
+        if bucket is None:
+            bucket = TokenBucket(rate, capacity)
+            _domain_buckets[domain] = bucket
+        else:
+            bucket.rate = rate
+            if capacity is not None:
+                bucket.capacity = capacity
+        return bucket
+
+
+def backoff_delay(attempt: int, min_backoff: float, max_backoff: float) -> float:
+    """
+    Reconnect delay of an attempt, full jitter over an exponentially growing window
+
+    Spreading the delay over the whole window keeps many clients that lost
+    their connection at once from reconnecting at once.
+    """
+    return random.uniform(0, min(max_backoff, min_backoff * 2 ** attempt))
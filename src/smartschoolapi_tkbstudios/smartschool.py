@@ -3,16 +3,259 @@ SmartSchool client API class
 """
 import json
 import logging
-from xml.etree import ElementTree
+import os
 from uuid import uuid4
 import re
 import datetime
+import threading
+import time
 import urllib
-import colorlog
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 import requests
-import websocket
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .cache import MISSING, PUSH_INVALIDATED_ENDPOINTS, MemoryCache, cached
+from .events import (
+    AuthEvent,
+    EventRegistry,
+    Notification,
+    NotificationConfigRequest,
+    NotificationListStart,
+    decode_event,
+    loads,
+)
+from .models import Message, MessageSummary
+from .notifications import BLOCK, DROP_OLDEST, CallbackDispatcher, NotificationQueue
+from .parsers import CHUNK_SIZE, iter_attachments, iter_message_summaries, parse_message
+from .ratelimit import TokenBucket, backoff_delay, get_domain_bucket
 
 OFFICE365_SSO_INIT_URI = "/login/sso/init/office365"
+WEBSOCKET_URL = "wss://nodejs-gs.smartschool.be/smsc/websocket"
+DEFAULT_TIMEOUT = 10
+VALIDATORS_CACHE_SIZE = 256
+DATE_PATTERN = re.compile(r'^[0-9]{4}-[0-9]{2}-[0-9]{2}$')
+CONTENT_RANGE_START = re.compile(r'^bytes (\d+)-')
+
+# notification module -> endpoints whose cached data it makes stale
+NOTIFICATION_INVALIDATIONS = {
+    'Messages': ('list_messages',),
+    'Results': ('get_results',),
+    'Planner': ('get_planner',),
+}
+
+
+def postboxes_command(action: str, params: dict) -> str:
+    """
+    Build a postboxes dispatcher command
+
+    Args:
+        action: dispatcher action, e.g. "message list"
+        params: command parameters, values are wrapped in CDATA
+    """
+    params_xml = ''.join(
+        f'<param name="{name}"><![CDATA[{value}]]></param>' for name, value in params.items()
+    )
+    return (
+        '<request>'
+        '<command>'
+        '<subsystem>postboxes</subsystem>'
+        f'<action>{action}</action>'
+        f'<params>{params_xml}</params>'
+        '</command>'
+        '</request>'
+    )
+
+
+def message_list_command(box_type: str = 'inbox', box_id: int = 0,
+                         offset: int = None, limit: int = None) -> str:
+    """
+    Build a postboxes "message list" command
+
+    Args:
+        box_type: box to list (inbox, outbox, trash, ...)
+        box_id: box id, 0 for the default boxes
+        offset: index of the first message of the page
+        limit: number of messages in the page
+    """
+    params = {
+        'boxType': box_type,
+        'boxID': box_id,
+        'sortField': 'date',
+        'sortKey': 'desc',
+        'poll': 'false',
+        'poll_ids': '',
+        'layout': 'new',
+    }
+    if offset is not None:
+        params['offset'] = offset
+    if limit is not None:
+        params['limit'] = limit
+    return postboxes_command('message list', params)
+
+
+def check_token_message(token: str) -> str:
+    """
+    Websocket message authenticating the connection with a token from get_token_from_api
+    """
+    return json.dumps({
+        "type": "auth",
+        "request": "checkToken",
+        "token": token
+    })
+
+
+def set_config_message() -> str:
+    """
+    Websocket reply to getNotificationConfig, subscribing to notifications
+    """
+    return json.dumps({
+        "type": "setConfig",
+        "queueUuid": uuid4().hex,
+    })
+
+
+def make_adapter(pool_connections: int = 10, pool_maxsize: int = 10,
+                 pool_block: bool = False, max_retries: int = 3) -> HTTPAdapter:
+    """
+    Build a pooled HTTPAdapter retrying failed connections and 502/503/504 responses
+    """
+    return HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+        max_retries=Retry(
+            total=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False
+        )
+    )
+
+
+CONSOLE_HANDLER_NAME = 'smartschoolapi-console'
+LOG_FORMAT = '%(log_color)s%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+api_logger = logging.getLogger("Core/API")
+websocket_logger = logging.getLogger("Core/Websocket")
+auth_logger = logging.getLogger("Core/Authentication")
+LOGGERS = (api_logger, websocket_logger, auth_logger)
+
+
+def enable_logging(loglevel: int = logging.DEBUG, handler: logging.Handler = None):
+    """
+    Log to the console (or to handler) at loglevel
+
+    Safe to call many times: a handler is only added once to each logger.
+    """
+    if handler is None:
+        handler = next((existing for existing in api_logger.handlers
+                        if existing.get_name() == CONSOLE_HANDLER_NAME), None)
+    if handler is None:
+        import colorlog  # pylint: disable=import-outside-toplevel
+        handler = colorlog.StreamHandler()
+        handler.set_name(CONSOLE_HANDLER_NAME)
+        handler.setFormatter(colorlog.ColoredFormatter(LOG_FORMAT))
+    for logger in LOGGERS:
+        logger.addHandler(handler)
+        logger.setLevel(loglevel)
+
+
+def get_loggers(loglevel: int = None):
+    """
+    Get the API, Websocket and Authentication loggers
+
+    The loggers are shared by every client and have no handler of their own;
+    passing loglevel calls enable_logging(loglevel).
+    """
+    if loglevel is not None:
+        enable_logging(loglevel)
+    return api_logger, websocket_logger, auth_logger
+
+
+def _planned_element_days(planned_element, default_day):
+    """
+    Days covered by a planned element, default_day if its period is unknown
+    """
+    period = planned_element.get('period') or {}
+    try:
+        first_day = datetime.date.fromisoformat(period['dateTimeFrom'][:10])
+        last_day = datetime.date.fromisoformat(period['dateTimeTo'][:10])
+    except (KeyError, TypeError, ValueError):
+        return [default_day]
+    return [first_day + datetime.timedelta(days=offset)
+            for offset in range(max((last_day - first_day).days, 0) + 1)]
+
+
+def _walk_tree(name, fetch, root, expand, concurrency: int, max_depth: int = None):
+    """
+    Crawl a tree breadth-first on a pool of concurrency workers
+
+    Every key is fetched at most once and items are yielded as soon as the
+    request producing them completes.
+
+    Args:
+        name: what is crawled, for error messages
+        fetch: fetch(key) -> result of one request, None on failure
+        root: key of the root
+        expand: expand(key, depth, result) -> (items to yield, keys of the children to fetch)
+        concurrency: maximum number of requests in flight
+        max_depth: children of keys at this depth are not fetched, None for no limit
+    """
+    seen = {root}
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        pending = {executor.submit(fetch, root): (root, 0)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, depth = pending.pop(future)
+                result = future.result()
+                if result is None:
+                    raise ApiException(f"Could not get {name} {key!r}")
+                items, children = expand(key, depth, result)
+                yield from items
+                if max_depth is not None and depth >= max_depth:
+                    continue
+                for child in children:
+                    if child not in seen:
+                        seen.add(child)
+                        pending[executor.submit(fetch, child)] = (child, depth + 1)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _content_range_total(response):
+    """
+    Total size in the Content-Range header (bytes 0-99/1234 or bytes */1234), None if absent
+    """
+    content_range = response.headers.get('Content-Range')
+    if content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        if total.isdigit():
+            return int(total)
+    return None
+
+
+def _content_range_start(response):
+    """
+    First byte in the Content-Range header (bytes 100-199/1234), None if absent
+    """
+    match = CONTENT_RANGE_START.match(response.headers.get('Content-Range', ''))
+    return int(match.group(1)) if match else None
+
+
+def _content_total(response, offset):
+    """
+    Total size of a (partial) download announced by the server, None if unknown
+    """
+    total = _content_range_total(response)
+    if total is not None:
+        return total
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit() and 'Content-Encoding' not in response.headers:
+        return offset + int(content_length)
+    return None
 
 
 class ApiException(Exception):
@@ -27,21 +270,51 @@ class AuthException(ApiException):
     """
 
 
+class ResultsException(ApiException):
+    """
+    Results exception
+    """
+
+
 class SmartSchoolClient:
     """
     SmartSchool client
 
     Args:
         domain: SmartSchool domain
-        loglevel: logging level
+        loglevel: console logging level, None (default) leaves logging unconfigured
+        pool_connections: number of per-host connection pools to keep
+        pool_maxsize: maximum number of connections kept alive per host
+        pool_block: block instead of opening extra connections once pool_maxsize is reached
+        max_retries: retries for failed connections and 502/503/504 responses
+        keep_alive: reuse connections between requests
+        timeout: default request timeout in seconds
+        adapter: HTTPAdapter to use instead of creating one, allows sharing a pool
+        cache: ResponseCache for read-only endpoints, None disables caching
+        planner_cache: PlannerCache used by get_planner, None disables it
+        scheme: URL scheme of the domain, "http" for a local stand-in server
+        websocket_url: notification WebSocket URL
 
     Attributes:
         domain: SmartSchool domain
-        phpsessid: PHPSESSID
-        pid: pid
+        scheme: URL scheme of the domain
+        websocket_url: notification WebSocket URL
+        session: requests session used for every call
+        cache: ResponseCache or None
+        planner_cache: PlannerCache or None
+        intradesk_index: intradesk path -> folder, filled by a complete walk_intradesk()
+        rate_limiter: TokenBucket every request waits on, or None
+        stats: RequestStats recording the latency and errors of every request, or None
+        phpsessid: PHPSESSID (stored in the session cookie jar)
+        pid: pid (stored in the session cookie jar)
         user_id: user id
         platform_id: platform id
-        received_message_callback: callback function
+        received_message_callback: callback function, see dispatch_callbacks()
+        event_handlers: EventRegistry of handlers called with typed Websocket events
+        push_invalidations: notification module -> endpoints, see enable_push_invalidation()
+        refresh_callback: called with (endpoint, value) after a background refresh
+        gap_callback: called with websocket_gaps when the Websocket is back after a drop
+        websocket_gaps: number of times an authenticated Websocket connection dropped
 
         api_logger: logger for API
         websocket_logger: logger for Websocket
@@ -51,40 +324,286 @@ class SmartSchoolClient:
         check_if_authenticated()
         get_token_from_api()
         get_messages_from_api()
-        get_message_by_id(message_id)
+        get_message_by_id(message_id, typed=False)
+        get_messages_by_ids(message_ids, max_workers=5, rate_limit=None, typed=False)
         get_school_courses()
+        get_results(page=1, per_page=50)
+        iter_results(per_page=50)
         get_planner(from_date=None, to_date=None)
-        list_messages()
-        run_websocket()
+        get_planner_range(start, end, chunk_days=7, max_workers=4)
+        list_messages(box_type='inbox', box_id=0, typed=False)
+        iter_messages(box_type='inbox', box_id=0, page_size=50, typed=False)
+        walk_upload_zone(course_id, max_depth=None, concurrency=4)
+        walk_intradesk(max_depth=None, concurrency=4)
+        list_message_attachments(message_id)
+        download_message_attachment(file_id, destination)
+        download_file(path, destination, expected_size=None, resume=True, bucket=None)
+        download_files(downloads, max_workers=4, bandwidth_limit=None)
+        find_intradesk_folder(path)
+        run_websocket(reconnect=True, ping_interval=30, ping_timeout=10)
+        start_websocket(**kwargs)
+        stop_websocket()
+        notifications(maxsize=1000, overflow=DROP_OLDEST)
+        subscribe(maxsize=1000, overflow=DROP_OLDEST)
+        dispatch_callbacks(workers=4, maxsize=1000, overflow=BLOCK)
+        invalidate_cache(endpoint=None)
+        enable_push_invalidation(refresh=False, refresh_callback=None, invalidations=None)
+        disable_push_invalidation()
+        close()
     """
 
-    def __init__(self, domain: str = None, loglevel: int = logging.DEBUG):
-        self.domain = domain
+    def __init__(self, domain: str = None, loglevel: int = None,
+                 pool_connections: int = 10, pool_maxsize: int = 10,
+                 pool_block: bool = False, max_retries: int = 3,
+                 keep_alive: bool = True, timeout: float = DEFAULT_TIMEOUT,
+                 adapter: HTTPAdapter = None, cache=None, planner_cache=None,
+                 scheme: str = 'https', websocket_url: str = WEBSOCKET_URL):
+        self._domain = domain
+        self.scheme = scheme
+        self.websocket_url = websocket_url
+        self.timeout = timeout
+        self.cache = cache
+        self.planner_cache = planner_cache
+        self.intradesk_index = None
+        self.rate_limiter = None
+        self.stats = None
+        self._validators = MemoryCache(maxsize=VALIDATORS_CACHE_SIZE)
+        self.websocket_gaps = 0
+        self.gap_callback = None
+        self._websocket = None
+        self._websocket_stop = threading.Event()
+        self._websocket_authenticated = False
+        self._websocket_token_refreshed = False
+        self._websocket_gap_pending = False
+        self._websocket_thread = None
+        self._notification_queues = []
+        self._callback_dispatcher = None
+        self.event_handlers = EventRegistry()
+        self.push_invalidations = None
+        self.refresh_callback = None
+        self._refresh_executor = None
+        self._refresh_pending = set()
+        self._refresh_lock = threading.Lock()
+        self.session = requests.Session()
+        if adapter is None:
+            adapter = make_adapter(pool_connections, pool_maxsize, pool_block, max_retries)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
         self.platform_id = None
-        self.phpsessid = None
-        self.pid = None
         self.user_id = None
         self.received_message_callback = None
         self.user_token = None
 
-        colorlog_handler = colorlog.StreamHandler()
-        colorlog_handler.setFormatter(
-            colorlog.ColoredFormatter(
-                '%(log_color)s%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-            )
+        self.api_logger, self.websocket_logger, self.auth_logger = get_loggers(loglevel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """
+        Close the session and release pooled connections, stop the Websocket
+        """
+        self.stop_websocket()
+        for events in self._notification_queues:
+            events.close()
+        if self._refresh_executor is not None:
+            self._refresh_executor.shutdown(wait=False, cancel_futures=True)
+            self._refresh_executor = None
+        self.session.close()
+
+    def invalidate_cache(self, endpoint: str = None):
+        """
+        Drop this account's cached responses, only those of endpoint if given
+
+        get_planner drops this account's days from planner_cache.
+        """
+        if self.cache is not None:
+            self.cache.invalidate(domain=self.domain, user=self.user_id, endpoint=endpoint)
+        if self.planner_cache is not None and endpoint in (None, 'get_planner'):
+            self.planner_cache.invalidate(account=(self.domain, self.user_id))
+
+    def enable_push_invalidation(self, refresh: bool = False, refresh_callback=None,
+                                 invalidations: dict = None):
+        """
+        Invalidate cached data when a Websocket notification says it changed
+
+        A notification of a module in invalidations drops the cached data of
+        its endpoints (see invalidate_cache), so the cache can be given long
+        ttls instead of polling. After a Websocket gap every mapped endpoint is
+        invalidated, since notifications may have been missed. Endpoints that
+        change often (list_messages, get_results) are only cached while push
+        invalidation is on.
+
+        Args:
+            refresh: fetch invalidated endpoints again in a background thread,
+                one refresh per endpoint at a time
+            refresh_callback: called with (endpoint, value) after each refresh
+            invalidations: notification module -> endpoints, defaults to
+                NOTIFICATION_INVALIDATIONS
+        """
+        self.push_invalidations = dict(
+            NOTIFICATION_INVALIDATIONS if invalidations is None else invalidations
         )
+        self.refresh_callback = refresh_callback
+        if refresh and self._refresh_executor is None:
+            self._refresh_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="smartschool-refresh"
+            )
+        self.event_handlers.unregister(Notification, self._on_push_notification)
+        self.event_handlers.register(Notification, self._on_push_notification)
+
+    def disable_push_invalidation(self):
+        """
+        Stop invalidating cached data on notifications
+        """
+        self.event_handlers.unregister(Notification, self._on_push_notification)
+        self.push_invalidations = None
+        # no longer kept fresh, so they must not be served when push invalidation is back on
+        for endpoint in PUSH_INVALIDATED_ENDPOINTS:
+            self.invalidate_cache(endpoint)
+        if self._refresh_executor is not None:
+            self._refresh_executor.shutdown(wait=False, cancel_futures=True)
+            self._refresh_executor = None
+
+    def _on_push_notification(self, event):
+        if self.push_invalidations is not None:
+            self._invalidate_endpoints(self.push_invalidations.get(event.module, ()))
+
+    def _invalidate_endpoints(self, endpoints):
+        for endpoint in endpoints:
+            self.api_logger.debug("Invalidating %s", endpoint)
+            self.invalidate_cache(endpoint)
+            if self._refresh_executor is not None:
+                self._schedule_refresh(endpoint)
+
+    def _schedule_refresh(self, endpoint):
+        with self._refresh_lock:
+            if endpoint in self._refresh_pending:
+                return
+            self._refresh_pending.add(endpoint)
+        self._refresh_executor.submit(self._refresh, endpoint)
+
+    def _refresh(self, endpoint):
+        """
+        Fetch an endpoint again with its default arguments, filling the caches
+        """
+        with self._refresh_lock:
+            # a notification arriving from now on needs another refresh
+            self._refresh_pending.discard(endpoint)
+        # an earlier refresh may have cached data from before this notification
+        self.invalidate_cache(endpoint)
+        try:
+            value = getattr(self, endpoint)()
+        except (ApiException, requests.RequestException) as error:
+            self.api_logger.error("Could not refresh %s: %s", endpoint, error)
+            return
+        if self.refresh_callback is not None:
+            self.refresh_callback(endpoint, value)
 
-        self.api_logger = colorlog.getLogger("Core/API")
-        self.api_logger.addHandler(colorlog_handler)
-        self.api_logger.setLevel(loglevel)
+    @property
+    def domain(self):
+        """
+        SmartSchool domain, session cookies are scoped to it
+        """
+        return self._domain
+
+    @domain.setter
+    def domain(self, value):
+        phpsessid, pid = self.phpsessid, self.pid
+        self.session.cookies.clear()
+        self._domain = value
+        self.phpsessid, self.pid = phpsessid, pid
+
+    @property
+    def phpsessid(self):
+        """
+        PHPSESSID cookie
+        """
+        return self._get_cookie('PHPSESSID')
+
+    @phpsessid.setter
+    def phpsessid(self, value):
+        self._set_cookie('PHPSESSID', value)
+
+    @property
+    def pid(self):
+        """
+        pid cookie
+        """
+        return self._get_cookie('pid')
 
-        self.websocket_logger = colorlog.getLogger("Core/Websocket")
-        self.websocket_logger.addHandler(colorlog_handler)
-        self.websocket_logger.setLevel(loglevel)
+    @pid.setter
+    def pid(self, value):
+        self._set_cookie('pid', value)
 
-        self.auth_logger = colorlog.getLogger("Core/Authentication")
-        self.auth_logger.addHandler(colorlog_handler)
-        self.auth_logger.setLevel(loglevel)
+    def _cookie_domain(self):
+        return (self._domain or '').split(':')[0]
+
+    def _get_cookie(self, name):
+        return self.session.cookies.get(name, domain=self._cookie_domain())
+
+    def _set_cookie(self, name, value):
+        if value is None:
+            self.session.cookies.pop(name, None)
+            return
+        self.session.cookies.set(name, value, domain=self._cookie_domain())
+
+    def _request(self, method, path, **kwargs):
+        """
+        Send a request to the SmartSchool domain over the pooled session
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if not path.startswith(('https://', 'http://')):
+            path = f'{self.scheme}://{self._domain}{path}'
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        if self.stats is None:
+            return self.session.request(method, path, **kwargs)
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, path, **kwargs)
+        except requests.RequestException:
+            self.stats.record(time.monotonic() - start, error=True)
+            raise
+        self.stats.record(time.monotonic() - start, error=response.status_code >= 400)
+        return response
+
+    def _conditional_get_json(self, path, headers=None):
+        """
+        GET a JSON endpoint, revalidating the previous response with ETag/Last-Modified
+
+        On 304 Not Modified the previously decoded object is returned without
+        downloading or decoding the body again.
+
+        Returns:
+            (received, value): received is False when the request failed
+        """
+        headers = dict(headers or {})
+        previous = self._validators.get(path)
+        if previous is not MISSING:
+            etag, last_modified, _ = previous
+            if etag is not None:
+                headers['If-None-Match'] = etag
+            if last_modified is not None:
+                headers['If-Modified-Since'] = last_modified
+        response = self._request('GET', path, headers=headers)
+        if response.status_code == 304 and previous is not MISSING:
+            self.api_logger.debug("Not modified: %s", path)
+            return True, previous[2]
+        if response.status_code != 200:
+            return False, None
+        value = response.json()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag is not None or last_modified is not None:
+            self._validators.set(path, (etag, last_modified, value), float('inf'))
+        return True, value
 
     def check_if_authenticated(self):
         """
@@ -92,11 +611,9 @@ class SmartSchoolClient:
         """
         if self.pid is None or self.phpsessid is None:
             raise AuthException("PID or PHPSESSID are not set")
-        response = requests.get(
-            f'https://{self.domain}/',
-            headers={
-                'Cookie': f'PHPSESSID={self.phpsessid}; pid={self.pid}'
-            },
+        response = self._request(
+            'GET',
+            '/',
             allow_redirects=False
         )
         if response.status_code == 302:
@@ -113,15 +630,12 @@ class SmartSchoolClient:
         """
         self.api_logger.info("Requesting token from API")
         self.api_logger.debug("Sending request to get token")
-        response = requests.get(
-            f'https://{self.domain}/Topnav/Node/getToken',
-            headers={
-                'Cookie': f'PHPSESSID={self.phpsessid}; pid={self.pid}'
-            },
+        response = self._request(
+            'GET',
+            '/Topnav/Node/getToken',
             json={
                 'userID': self.user_id
-            },
-            timeout=10
+            }
         )
         if response.status_code == 200:
             self.api_logger.info("Token received")
@@ -136,77 +650,113 @@ class SmartSchoolClient:
         """
         self.api_logger.info("Requesting user from API")
         self.api_logger.debug("Sending request to get user")
-        response = requests.post(
-            f'https://{self.domain}/?module=Messages&file=searchUsers',
+        response = self._request(
+            'POST',
+            '/?module=Messages&file=searchUsers',
             headers={
-                "Cookie": f"pid={self.pid}; PHPSESSID={self.phpsessid}",
                 "Content-Type": "application/x-www-form-urlencoded",
             },
-            data=f"val={name}&type=0&parentNodeId=insertSearchFieldContainer_0_0&xml=<results></results>",
-            timeout=10
+            data=f"val={name}&type=0&parentNodeId=insertSearchFieldContainer_0_0&xml=<results></results>"
         )
         if response.status_code == 200:
             self.api_logger.info("User received")
-            root = ElementTree.fromstring(response.text)
-            users = []
-            for user_elem in root.findall('.//user'):
-                user = {
-                    'userID': user_elem.find('userID').text,
-                    'text': user_elem.find('text').text,
-                    'value': user_elem.find('value').text,
-                    'selectable': user_elem.find('selectable').text,
-                    'ssID': user_elem.find('ssID').text,
-                    'classname': user_elem.find('classname').text,
-                    'schoolname': user_elem.find('schoolname').text,
-                    'picture': user_elem.find('picture').text
-                }
-                users.append(user)
-            return users
+            return self.parse_users_response(response.text)
         self.api_logger.error("Could not get user")
         raise ApiException("Could not get user")
 
-    def list_messages(self):
+    @staticmethod
+    def parse_users_response(response_text):
+        """
+        Parse users from searchUsers API response
+        """
+        from xml.etree import ElementTree  # pylint: disable=import-outside-toplevel
+        root = ElementTree.fromstring(response_text)
+        users = []
+        for user_elem in root.findall('.//user'):
+            user = {
+                'userID': user_elem.find('userID').text,
+                'text': user_elem.find('text').text,
+                'value': user_elem.find('value').text,
+                'selectable': user_elem.find('selectable').text,
+                'ssID': user_elem.find('ssID').text,
+                'classname': user_elem.find('classname').text,
+                'schoolname': user_elem.find('schoolname').text,
+                'picture': user_elem.find('picture').text
+            }
+            users.append(user)
+        return users
+
+    def list_messages(self, box_type: str = 'inbox', box_id: int = 0, typed: bool = False):
         """
         Request messages from API
-        Currently limited to maximum 50 messages
-        :return:
+        Currently limited to maximum 50 messages, use iter_messages() to walk a whole box
+
+        Args:
+            box_type: box to list (inbox, outbox, trash, ...)
+            box_id: box id, 0 for the default boxes
+            typed: return MessageSummary records instead of dicts
+        """
+        messages = self._get_message_list(box_type, box_id)
+        if typed:
+            return [MessageSummary.from_dict(message) for message in messages]
+        return messages
+
+    @cached('list_messages', push_invalidated=True)
+    def _get_message_list(self, box_type, box_id):
+        return self._list_messages(message_list_command(box_type, box_id))
+
+    def iter_messages(self, box_type: str = 'inbox', box_id: int = 0, page_size: int = 50,
+                      typed: bool = False):
+        """
+        Walk a whole message box page by page
+
+        Only one page is held in memory at a time, stop iterating to stop fetching.
+
+        Args:
+            box_type: box to list (inbox, outbox, trash, ...)
+            box_id: box id, 0 for the default boxes
+            page_size: messages requested per page
+            typed: yield MessageSummary records instead of dicts
+        """
+        offset = 0
+        previous_ids = None
+        while True:
+            messages = self._list_messages(
+                message_list_command(box_type, box_id, offset=offset, limit=page_size)
+            )
+            message_ids = [message['id'] for message in messages]
+            # a server ignoring the paging parameters keeps returning the same page
+            if not messages or message_ids == previous_ids:
+                return
+            if typed:
+                yield from map(MessageSummary.from_dict, messages)
+            else:
+                yield from messages
+            if len(messages) < page_size:
+                return
+            previous_ids = message_ids
+            offset += len(messages)
+
+    def _list_messages(self, command):
+        """
+        Send a message list command and parse the listed messages
         """
         self.api_logger.info("Requesting messages from API")
         self.api_logger.debug("Sending request to get messages")
         headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
             'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
             'X-Requested-With': 'XMLHttpRequest',
         }
-        data = {
-            'command': (
-                '<request>'
-                '<command>'
-                '<subsystem>postboxes</subsystem>'
-                '<action>message list</action>'
-                '<params>'
-                '<param name="boxType"><![CDATA[inbox]]></param>'
-                '<param name="boxID"><![CDATA[0]]></param>'
-                '<param name="sortField"><![CDATA[date]]></param>'
-                '<param name="sortKey"><![CDATA[desc]]></param>'
-                '<param name="poll"><![CDATA[false]]></param>'
-                '<param name="poll_ids"><![CDATA[]]></param>'
-                '<param name="layout"><![CDATA[new]]></param>'
-                '</params>'
-                '</command>'
-                '</request>'
-            )
-        }
-
-        response = requests.post(
-            f'https://{self.domain}/?module=Messages&file=dispatcher',
-            headers=headers,
-            data=data,
-            timeout=10
-        )
-        if response.status_code == 200:
-            self.api_logger.info("Messages received")
-            return self.parse_message_response(response.text)
+        with self._request(
+                'POST',
+                '/?module=Messages&file=dispatcher',
+                headers=headers,
+                data={'command': command},
+                stream=True
+        ) as response:
+            if response.status_code == 200:
+                self.api_logger.info("Messages received")
+                return self.parse_message_response(response.iter_content(CHUNK_SIZE))
         self.api_logger.error("Could not get messages")
         raise ApiException("Could not get messages")
 
@@ -214,105 +764,126 @@ class SmartSchoolClient:
     def parse_single_message_response(response_text):
         """
         Parse a single message from API response
+
+        Args:
+            response_text: response body, a file-like object or an iterable of chunks
         """
-        root = ElementTree.fromstring(response_text)
-        message_elem = root.find('.//message')
-        message = {
-            'id': message_elem.find('id').text,
-            'from': message_elem.find('from').text,
-            'to': message_elem.find('to').text,
-            'subject': message_elem.find('subject').text,
-            'date': message_elem.find('date').text,
-            'body': message_elem.find('body').text,
-            'status': message_elem.find('status').text,
-            'attachment': message_elem.find('attachment').text,
-            'unread': message_elem.find('unread').text,
-            'label': message_elem.find('label').text,
-            'receivers': [receiver.text for receiver in message_elem.findall('receivers/to')],
-            'ccreceivers': [receiver.text for receiver in message_elem.findall('ccreceivers/cc')],
-            'bccreceivers': [receiver.text for receiver in
-                             message_elem.findall('bccreceivers/bcc')],
-            'senderPicture': message_elem.find('senderPicture').text,
-            'markedInLVS': message_elem.find('markedInLVS').text,
-            'fromTeam': message_elem.find('fromTeam').text,
-            'totalNrOtherToReciviers': message_elem.find('totalNrOtherToReciviers').text,
-            'totalnrOtherCcReceivers': message_elem.find('totalnrOtherCcReceivers').text,
-            'totalnrOtherBccReceivers': message_elem.find('totalnrOtherBccReceivers').text,
-            'canReply': message_elem.find('canReply').text,
-            'hasReply': message_elem.find('hasReply').text,
-            'hasForward': message_elem.find('hasForward').text,
-            'sendDate': message_elem.find('sendDate').text,
-        }
-        return message
+        return parse_message(response_text)
 
     @staticmethod
     def parse_message_response(response_text):
         """
         Parse messages from API response
+
+        Args:
+            response_text: response body, a file-like object or an iterable of chunks
         """
-        root = ElementTree.fromstring(response_text)
-        messages = []
-        for message_elem in root.findall('.//message'):
-            message = {
-                'id': message_elem.find('id').text,
-                'from': message_elem.find('from').text,
-                'from_image': message_elem.find('fromImage').text,
-                'subject': message_elem.find('subject').text,
-                'date': message_elem.find('date').text,
-                'status': message_elem.find('status').text,
-                'attachment': message_elem.find('attachment').text,
-                'unread': message_elem.find('unread').text,
-                'label': message_elem.find('label').text,
-                'deleted': message_elem.find('deleted').text,
-                'allow_reply': message_elem.find('allowreply').text,
-                'allow_reply_enabled': message_elem.find('allowreplyenabled').text,
-                'has_reply': message_elem.find('hasreply').text,
-                'has_forward': message_elem.find('hasForward').text,
-                'real_box': message_elem.find('realBox').text,
-                'send_date': message_elem.find('sendDate').text
-            }
-            messages.append(message)
-        return messages
+        return list(iter_message_summaries(response_text))
 
-    def get_message_by_id(self, message_id):
+    def get_message_by_id(self, message_id, typed: bool = False):
         """
         Get message by ID
+
+        Args:
+            message_id: message ID
+            typed: return a Message record instead of a dict
         """
         self.api_logger.info("Requesting message from API")
         self.api_logger.debug("Sending request to get message with ID %s", message_id)
         headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
             'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
             'X-Requested-With': 'XMLHttpRequest',
         }
         data = {
-            'command': (
-                f'<request>'
-                f'<command>'
-                f'<subsystem>postboxes</subsystem>'
-                f'<action>show message</action>'
-                f'<params>'
-                f'<param name="msgID"><![CDATA[{message_id}]]></param>'
-                f'<param name="boxType"><![CDATA[inbox]]></param>'
-                f'<param name="limitList"><![CDATA[true]]></param>'
-                f'</params>'
-                f'</command>'
-                f'</request>'
-            )
+            'command': postboxes_command('show message', {
+                'msgID': message_id,
+                'boxType': 'inbox',
+                'limitList': 'true',
+            })
         }
 
-        response = requests.post(
-            f'https://{self.domain}/?module=Messages&file=dispatcher',
+        response = self._request(
+            'POST',
+            '/?module=Messages&file=dispatcher',
             headers=headers,
-            data=data,
-            timeout=10
+            data=data
         )
         if response.status_code == 200:
             self.api_logger.info("Message received")
-            return self.parse_single_message_response(response.text)
+            message = self.parse_single_message_response(response.content)
+            return Message.from_dict(message) if typed else message
         self.api_logger.error("Could not get message")
         raise ApiException("Could not get message")
 
+    def get_messages_by_ids(self, message_ids, max_workers: int = 5, rate_limit: float = None,
+                            typed: bool = False):
+        """
+        Get messages by ID concurrently, yielding each message as soon as it is received
+
+        Args:
+            message_ids: iterable of message IDs
+            max_workers: maximum number of requests in flight
+            rate_limit: maximum requests per second, shared by all clients of the same domain
+            typed: yield Message records instead of dicts
+        """
+        bucket = get_domain_bucket(self.domain, rate_limit) if rate_limit else None
+
+        def fetch(message_id):
+            if bucket is not None:
+                bucket.acquire()
+            return self.get_message_by_id(message_id, typed=typed)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [executor.submit(fetch, message_id) for message_id in message_ids]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def list_message_attachments(self, message_id):
+        """
+        List the attachments of a message
+
+        Returns:
+            list of dicts with fileID, name, mime, size, ... as sent by the API
+        """
+        self.api_logger.info("Requesting message attachments from API")
+        self.api_logger.debug("Sending request to get attachments of message %s", message_id)
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+            'X-Requested-With': 'XMLHttpRequest',
+        }
+        data = {
+            'command': postboxes_command('attachment list', {'msgID': message_id})
+        }
+        response = self._request(
+            'POST',
+            '/?module=Messages&file=dispatcher',
+            headers=headers,
+            data=data
+        )
+        if response.status_code == 200:
+            self.api_logger.info("Message attachments received")
+            return list(iter_attachments(response.content))
+        self.api_logger.error("Could not get message attachments")
+        raise ApiException("Could not get message attachments")
+
+    def download_message_attachment(self, file_id, destination: str, bucket: TokenBucket = None):
+        """
+        Download a message attachment, see download_file
+
+        Args:
+            file_id: fileID of an attachment from list_message_attachments
+            destination: file to write
+            bucket: TokenBucket in bytes per second to cap the bandwidth
+        """
+        return self.download_file(
+            f'/?module=Messages&file=download&fileID={file_id}&target=0',
+            destination,
+            bucket=bucket
+        )
+
     def delete_message_by_id(self, message_id):
         """
         Delete message by ID
@@ -321,30 +892,21 @@ class SmartSchoolClient:
         self.api_logger.debug("Sending request to delete message with ID %s", message_id)
 
         headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
             'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
             'X-Requested-With': 'XMLHttpRequest',
         }
 
         data_dict = {
-            'command': '<request>\n'
-                       '\t<command>\n'
-                       '\t\t<subsystem>postboxes</subsystem>\n'
-                       '\t\t<action>quick delete</action>\n'
-                       '\t\t<params>\n'
-                       f'\t\t\t<param name="msgID"><![CDATA[{message_id}]]></param>\n'
-                       '\t\t</params>\n'
-                       '\t</command>\n'
-                       '</request>'
+            'command': postboxes_command('quick delete', {'msgID': message_id})
         }
 
         data = urllib.parse.urlencode(data_dict)
 
-        response = requests.post(
-            f'https://{self.domain}/?module=Messages&file=dispatcher',
+        response = self._request(
+            'POST',
+            '/?module=Messages&file=dispatcher',
             headers=headers,
-            data=data,
-            timeout=10
+            data=data
         )
 
         if response.status_code == 200:
@@ -354,6 +916,7 @@ class SmartSchoolClient:
         self.api_logger.error("Could not delete message")
         raise ApiException("Could not delete message")
 
+    @cached('get_courses')
     def get_courses(self):
         """
         Get courses
@@ -361,14 +924,13 @@ class SmartSchoolClient:
         self.api_logger.info("Requesting courses from API")
         self.api_logger.debug("Sending request to get courses")
         headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
             'Content-Type': 'application/json, text/javascript, */*;',
             'X-Requested-With': 'XMLHttpRequest',
         }
-        response = requests.post(
-            f'https://{self.domain}/Topnav/getCourseConfig',
-            headers=headers,
-            timeout=10
+        response = self._request(
+            'POST',
+            '/Topnav/getCourseConfig',
+            headers=headers
         )
         if response.status_code == 200:
             self.api_logger.info("Courses received")
@@ -377,6 +939,7 @@ class SmartSchoolClient:
         self.api_logger.error("Could not get courses")
         raise ApiException("Could not get courses")
 
+    @cached('get_school_courses')
     def get_school_courses(self):
         """
         WARNING: IN DEVELOPMENT
@@ -385,21 +948,19 @@ class SmartSchoolClient:
         self.api_logger.info("Requesting school courses from API")
         self.api_logger.debug("Sending request to get school courses")
         headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
             'Accept': 'application/json',
         }
-        response = requests.get(
-            f'https://{self.domain}/course-list/api/v1/courses',
-            headers=headers,
-            timeout=10
+        received, courses_json = self._conditional_get_json(
+            '/course-list/api/v1/courses',
+            headers=headers
         )
-        if response.status_code == 200:
+        if received:
             self.api_logger.info("School courses received")
-            courses_json = json.loads(response.text)
             return courses_json
         self.api_logger.error("Could not get school courses")
         raise ApiException("Could not get school courses")
 
+    @cached('get_results', push_invalidated=True)
     def get_results(self, page: int = 1, per_page: int = 50):
         """
         Get results
@@ -407,21 +968,54 @@ class SmartSchoolClient:
         self.api_logger.info("Requesting results from API")
         self.api_logger.debug("Sending request to get results")
         headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
             'Content-Type': 'application/json',
             'Accept': '*/*'
         }
-        response = requests.get(
-            f'https://{self.domain}/results/api/v1/evaluations/?pageNumber={page}&itemsOnPage={per_page}',
-            headers=headers,
-            timeout=10
+        received, results_json = self._conditional_get_json(
+            f'/results/api/v1/evaluations/?pageNumber={page}&itemsOnPage={per_page}',
+            headers=headers
         )
-        if response.status_code == 200:
+        if received:
             self.api_logger.info("Results received")
-            results_json = json.loads(response.text)
             return results_json
         self.api_logger.error("Could not get results")
 
+    def iter_results(self, per_page: int = 50):
+        """
+        Walk all results page by page
+
+        The next page is fetched in the background while the current one is
+        consumed, iteration stops after the first short page.
+
+        Args:
+            per_page: results requested per page
+
+        Raises:
+            ValueError: per_page is smaller than 1
+            ResultsException: a page could not be fetched
+        """
+        if per_page < 1:
+            raise ValueError("per_page must be at least 1")
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            page = 1
+            future = executor.submit(self.get_results, page, per_page)
+            while True:
+                try:
+                    results = future.result()
+                except (requests.RequestException, ValueError) as error:
+                    raise ResultsException(f"Could not get results page {page}") from error
+                if results is None:
+                    raise ResultsException(f"Could not get results page {page}")
+                if len(results) >= per_page:
+                    future = executor.submit(self.get_results, page + 1, per_page)
+                yield from results
+                if len(results) < per_page:
+                    return
+                page += 1
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
     def get_planner(self, from_date=None, to_date=None):
         """
         Get planner
@@ -430,9 +1024,9 @@ class SmartSchoolClient:
             from_date: from date (YYYY-MM-DD)
             to_date: to date (YYYY-MM-DD)
         """
-        if from_date is not None and not re.match(r'^[0-9]{4}-[0-9]{2}-[0-9]{2}$', from_date):
+        if from_date is not None and not DATE_PATTERN.match(from_date):
             raise ValueError("from_date must be in format YYYY-MM-DD")
-        if to_date is not None and not re.match(r'^[0-9]{4}-[0-9]{2}-[0-9]{2}$', to_date):
+        if to_date is not None and not DATE_PATTERN.match(to_date):
             raise ValueError("to_date must be in format YYYY-MM-DD")
 
         if from_date is None:
@@ -444,42 +1038,133 @@ class SmartSchoolClient:
                     datetime.timedelta(days=7)
             ).strftime("%Y-%m-%d")
 
+        if self.planner_cache is not None:
+            return self._get_cached_planner(
+                datetime.date.fromisoformat(from_date),
+                datetime.date.fromisoformat(to_date)
+            )
+        return self._fetch_planner(from_date, to_date)
+
+    def _fetch_planner(self, from_date, to_date):
+        """
+        Request the planner of a date range from the API
+        """
         self.api_logger.info("Requesting planner from API")
         self.api_logger.debug("Sending request to get planner")
         headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
             'Content-Type': 'application/json',
             'Accept': '*/*'
         }
-        if from_date is None and to_date is None:
-            url = f'https://{self.domain}/planner/api/v1/planned-elements/user/{self.platform_id}_{self.user_id}_0'
-        else:
-            url = f"https://{self.domain}/planner/api/v1/planned-elements/user/{self.platform_id}{self.user_id}_0?from={from_date}&to={to_date}"
-        response = requests.get(
-            url=url,
-            headers=headers,
-            timeout=10
-        )
-        if response.status_code == 200:
+        path = (f"/planner/api/v1/planned-elements/user/{self.platform_id}{self.user_id}_0"
+                f"?from={from_date}&to={to_date}")
+        received, planner_json = self._conditional_get_json(path, headers=headers)
+        if received:
             self.api_logger.info("Planner received")
-            planner_json = response.json()
             return planner_json
         self.api_logger.error("Could not get planner")
         return None
 
+    def _get_cached_planner(self, first_day, last_day):
+        """
+        Assemble the planner of a date range from planner_cache, fetching only
+        the runs of missing or expired days
+        """
+        account = (self.domain, self.user_id)
+        days = [first_day + datetime.timedelta(days=offset)
+                for offset in range((last_day - first_day).days + 1)]
+        cached_days = {day: self.planner_cache.get(account, day) for day in days}
+
+        runs = []
+        for day in days:
+            if cached_days[day] is not None:
+                continue
+            if runs and runs[-1][-1] == day - datetime.timedelta(days=1):
+                runs[-1].append(day)
+            else:
+                runs.append([day])
+
+        for run in runs:
+            # the day after the run is requested too, whether "to" is inclusive or not
+            planned_elements = self._fetch_planner(
+                run[0].isoformat(), (run[-1] + datetime.timedelta(days=1)).isoformat()
+            )
+            if planned_elements is None:
+                return None
+            run_days = {day: [] for day in run}
+            for planned_element in planned_elements:
+                for day in _planned_element_days(planned_element, run[0]):
+                    if day in run_days:
+                        run_days[day].append(planned_element)
+            for day, day_elements in run_days.items():
+                self.planner_cache.store(account, day, day_elements)
+                cached_days[day] = day_elements
+
+        planned_elements = {}
+        for day in days:
+            for planned_element in cached_days[day]:
+                planned_elements[planned_element['id']] = planned_element
+        return sorted(
+            planned_elements.values(),
+            key=lambda planned_element: planned_element.get('period', {}).get('dateTimeFrom', '')
+        )
+
+    def get_planner_range(self, start, end, chunk_days: int = 7, max_workers: int = 4):
+        """
+        Get the planner of a long date range
+
+        The range is split in windows of chunk_days fetched in parallel, planned
+        elements seen in several windows are merged by ID and the result is
+        sorted by start date.
+
+        Args:
+            start: first date (datetime.date or YYYY-MM-DD)
+            end: last date (datetime.date or YYYY-MM-DD)
+            chunk_days: days per request
+            max_workers: maximum number of requests in flight
+        """
+        if isinstance(start, str):
+            start = datetime.date.fromisoformat(start)
+        if isinstance(end, str):
+            end = datetime.date.fromisoformat(end)
+        if end < start:
+            raise ValueError("end must not be before start")
+        if chunk_days < 1:
+            raise ValueError("chunk_days must be at least 1")
+
+        windows = []
+        window_start = start
+        while True:
+            window_end = min(window_start + datetime.timedelta(days=chunk_days), end)
+            windows.append((window_start.isoformat(), window_end.isoformat()))
+            if window_end >= end:
+                break
+            # windows share their boundary day, duplicates are merged below
+            window_start = window_end
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            chunks = list(executor.map(lambda window: self.get_planner(*window), windows))
+
+        planned_elements = {}
+        for window, chunk in zip(windows, chunks):
+            if chunk is None:
+                raise ApiException(f"Could not get planner from {window[0]} to {window[1]}")
+            for planned_element in chunk:
+                planned_elements[planned_element['id']] = planned_element
+        return sorted(
+            planned_elements.values(),
+            key=lambda planned_element: planned_element.get('period', {}).get('dateTimeFrom', '')
+        )
+
+    @cached('get_live_sessions')
     def get_live_sessions(self):
         """
         Get live sessions
         """
         self.api_logger.info("Requesting live sessions from API")
         self.api_logger.debug("Sending request to get live sessions")
-        headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
-        }
-        response = requests.get(
-            f'https://{self.domain}/online-session/api/v1/meeting/',
-            headers=headers,
-            timeout=10
+        response = self._request(
+            'GET',
+            '/online-session/api/v1/meeting/'
         )
         if response.status_code == 200:
             self.api_logger.info("Live sessions received")
@@ -494,13 +1179,9 @@ class SmartSchoolClient:
         """
         self.api_logger.info("Requesting course live sessions from API")
         self.api_logger.debug("Sending request to get course live sessions")
-        headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
-        }
-        response = requests.get(
-            f'https://{self.domain}/course/api/v1/video-call/{self.platform_id}/{course_id}',
-            headers=headers,
-            timeout=10
+        response = self._request(
+            'GET',
+            f'/course/api/v1/video-call/{self.platform_id}/{course_id}'
         )
         if response.status_code == 200:
             self.api_logger.info("Course live sessions received")
@@ -521,14 +1202,13 @@ class SmartSchoolClient:
         self.api_logger.info("Requesting upload zone dir from API")
         self.api_logger.debug("Sending request to get upload zone dir")
         headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
             'Content-Type': 'application/x-www-form-urlencoded'
         }
-        response = requests.post(
-            f'https://{self.domain}/?module=Uploadzone&file=tree&ssID={self.platform_id}&courseID={course_id}',
+        response = self._request(
+            'POST',
+            f'/?module=Uploadzone&file=tree&ssID={self.platform_id}&courseID={course_id}',
             headers=headers,
-            data="id=" + dir_id,
-            timeout=10
+            data="id=" + dir_id
         )
         if response.status_code == 200:
             self.api_logger.info("Upload zone dir received")
@@ -537,6 +1217,123 @@ class SmartSchoolClient:
         self.api_logger.error("Could not get upload zone dir")
         return None
 
+    def walk_upload_zone(self, course_id: int, max_depth: int = None, concurrency: int = 4):
+        """
+        Crawl the whole upload zone of a course breadth-first
+
+        Folders are fetched by a pool of concurrency workers and yielded as soon
+        as they are received, every folder ID is fetched at most once. Children
+        reported without children of their own are yielded without a request.
+
+        Args:
+            course_id: course id
+            max_depth: deepest level to crawl, the root is level 0, None for no limit
+            concurrency: maximum number of requests in flight
+        """
+        # leaves are never fetched, so _walk_tree does not see their IDs
+        seen_leaves = set()
+
+        def expand(_, depth, nodes):
+            items = list(nodes)
+            children = []
+            if max_depth is not None and depth >= max_depth:
+                return items, children
+            for child in [child for node in nodes for child in node.get('children') or []]:
+                if 'data' in child and not child.get('hasChildren', True):
+                    leaf_id = str(child['attributes']['id'])
+                    if leaf_id not in seen_leaves:
+                        seen_leaves.add(leaf_id)
+                        items.append(child)
+                else:
+                    children.append(str(child['attributes']['id']))
+            return items, children
+
+        return _walk_tree(
+            "upload zone dir",
+            lambda dir_id: self.get_upload_zone_dir(course_id, dir_id),
+            "0", expand, concurrency, max_depth
+        )
+
+    def download_file(self, path: str, destination: str, expected_size: int = None,
+                      resume: bool = True, bucket: TokenBucket = None):
+        """
+        Download a file to disk in chunks
+
+        Data is written to destination + ".part" and moved to destination once
+        complete. An existing .part file is resumed with an HTTP Range request.
+
+        Args:
+            path: path on the SmartSchool domain or full URL
+            destination: file to write
+            expected_size: size in bytes to verify, defaults to the size announced by the server
+            resume: resume an interrupted download instead of starting over
+            bucket: TokenBucket in bytes per second to cap the bandwidth
+
+        Raises:
+            ApiException: the download failed or the size does not match
+        """
+        partial = destination + '.part'
+        offset = os.path.getsize(partial) if resume and os.path.exists(partial) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+        self.api_logger.info("Downloading %s", path)
+        with self._request('GET', path, headers=headers, stream=True) as response:
+            # a resumed range the partial file does not line up with restarts the download
+            restart = False
+            if response.status_code == 416 and offset:
+                # the range starts at the end of the file when the partial file holds all of it
+                total = expected_size or _content_range_total(response)
+                restart = offset != total
+            elif response.status_code == 206 and _content_range_start(response) != offset:
+                restart = True
+            elif response.status_code in (200, 206):
+                if response.status_code == 200:
+                    offset = 0
+                total = expected_size or _content_total(response, offset)
+                with open(partial, 'ab' if offset else 'wb') as file:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        if bucket is not None:
+                            bucket.acquire(len(chunk))
+                        file.write(chunk)
+            else:
+                self.api_logger.error("Could not download %s", path)
+                raise ApiException(f"Could not download {path}: HTTP {response.status_code}")
+
+        if restart:
+            self.api_logger.warning("Restarting download of %s, the partial file does not "
+                                    "match the server's range", path)
+            os.remove(partial)
+            return self.download_file(path, destination, expected_size, resume=False,
+                                      bucket=bucket)
+        size = os.path.getsize(partial)
+        if total is not None and size != total:
+            raise ApiException(f"Incomplete download of {path}: {size} of {total} bytes")
+        os.replace(partial, destination)
+        self.api_logger.info("Downloaded %s (%s bytes)", path, size)
+        return destination
+
+    def download_files(self, downloads, max_workers: int = 4, bandwidth_limit: float = None):
+        """
+        Download files concurrently, yielding each destination once it is complete
+
+        Args:
+            downloads: iterable of (path, destination) or (path, destination, expected_size)
+            max_workers: maximum number of downloads in flight
+            bandwidth_limit: maximum bytes per second shared by all downloads
+        """
+        bucket = TokenBucket(bandwidth_limit) if bandwidth_limit else None
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [
+                executor.submit(self.download_file, *download, bucket=bucket)
+                for download in downloads
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @cached('get_helpdesk_tickets_filters')
     def get_helpdesk_tickets_filters(self):
         """
         Get helpdesk tickets filter
@@ -544,13 +1341,12 @@ class SmartSchoolClient:
         self.api_logger.info("Requesting tickets filter from API")
         self.api_logger.debug("Sending request to get tickets filter")
         headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
             'Accept': 'application/json'
         }
-        response = requests.get(
-            f'https://{self.domain}/helpdesk/api/v1/filters/',
-            headers=headers,
-            timeout=10
+        response = self._request(
+            'GET',
+            '/helpdesk/api/v1/filters/',
+            headers=headers
         )
         if response.status_code == 200:
             self.api_logger.info("Tickets filter received")
@@ -566,13 +1362,12 @@ class SmartSchoolClient:
         self.api_logger.info("Requesting tickets from API")
         self.api_logger.debug("Sending request to get tickets")
         headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
             'Accept': 'application/json'
         }
-        response = requests.get(
-            f'https://{self.domain}/helpdesk/api/v1/tickets/filter/{filter_id}',
-            headers=headers,
-            timeout=10
+        response = self._request(
+            'GET',
+            f'/helpdesk/api/v1/tickets/filter/{filter_id}',
+            headers=headers
         )
         if response.status_code == 200:
             self.api_logger.info("Tickets received")
@@ -581,23 +1376,26 @@ class SmartSchoolClient:
         self.api_logger.error("Could not get tickets")
         return None
 
+    @cached('intradesk_get_directory')
     def intradesk_get_directory(self, directory: str = ""):
         """
         Get intradesk files
+
+        Args:
+            directory: folder id, empty for the top level
         """
         self.api_logger.info("Requesting intradesk files from API")
         self.api_logger.debug("Sending request to get intradesk files")
         headers = {
-            'Cookie': f'pid={self.pid}; PHPSESSID={self.phpsessid}',
             'Accept': 'application/json'
         }
-        response = requests.get(
-            f'https://{self.domain}/intradesk/api/v1/4005/directory-listing'
-            f'/forTreeOnlyFolders{'/{directory}' if directory else ""}',
-            headers=headers,
-            timeout=10
+        response = self._request(
+            'GET',
+            f'/intradesk/api/v1/{self.platform_id}/directory-listing'
+            '/forTreeOnlyFolders' + (f'/{directory}' if directory else ''),
+            headers=headers
         )
-        self.api_logger.debug("Response: %s", response.text)
+        self.api_logger.debug("Response status: %s", response.status_code)
         if response.status_code == 200:
             self.api_logger.info("Intradesk folders received")
             intradesk_files_json = response.json()
@@ -605,11 +1403,65 @@ class SmartSchoolClient:
         self.api_logger.error("Could not get intradesk folders")
         return None
 
+    def walk_intradesk(self, max_depth: int = None, concurrency: int = 4):
+        """
+        Crawl the intradesk folder tree breadth-first
+
+        Folders are yielded as (path, folder) as soon as their parent listing is
+        received, e.g. ("/Documents/2024", {...}), and recorded in intradesk_index.
+
+        Args:
+            max_depth: deepest folder level to list, top level folders are level 1,
+                None for no limit
+            concurrency: maximum number of requests in flight
+        """
+        paths = {"": ""}
+        index = {}
+
+        def expand(folder_id, _, listing):
+            items = []
+            children = []
+            for folder in listing.get('folders') or []:
+                path = f"{paths[folder_id]}/{folder['name']}"
+                paths[str(folder['id'])] = path
+                index[path] = folder
+                items.append((path, folder))
+                if folder.get('hasChildren', True):
+                    children.append(str(folder['id']))
+            return items, children
+
+        yield from _walk_tree(
+            "intradesk folder",
+            self.intradesk_get_directory, "", expand, concurrency,
+            None if max_depth is None else max_depth - 1
+        )
+        if max_depth is None:
+            self.intradesk_index = index
+
+    def find_intradesk_folder(self, path: str):
+        """
+        Get an intradesk folder by path, e.g. "/Documents/2024", None if it does not exist
+
+        The first lookup crawls the whole tree, later lookups use intradesk_index.
+        Set intradesk_index to None to crawl again.
+        """
+        if self.intradesk_index is None:
+            for _ in self.walk_intradesk():
+                pass
+        return self.intradesk_index.get('/' + path.strip('/'))
+
     # websockets
     def ws_on_error(self, _, error):
         """
         Websocket error
         """
+        import websocket  # pylint: disable=import-outside-toplevel
+        if self._websocket_stop.is_set():
+            return
+        if isinstance(error, websocket.WebSocketConnectionClosedException):
+            # the server closing the connection, run_websocket reconnects
+            self.websocket_logger.info("WebSocket connection closed by the server: %s", error)
+            return
         self.websocket_logger.error("Error: %s", error)
 
     def ws_on_close(self, _, close_status_code, close_msg):
@@ -624,50 +1476,279 @@ class SmartSchoolClient:
         Websocket open
         """
         self.websocket_logger.info("WebSocket connection opened")
-        auth_message = {
-            "type": "auth",
-            "request": "checkToken",
-            "token": self.user_token
-        }
-        ws.send(json.dumps(auth_message))
+        self._websocket_token_refreshed = False
+        self._send_check_token(ws)
+
+    def _send_check_token(self, ws):
+        ws.send(check_token_message(self.user_token))
+
+    def _refresh_websocket_token(self, ws):
+        """
+        Get a new token after checkToken failed and authenticate again, once per connection
+        """
+        if self._websocket_token_refreshed:
+            self.websocket_logger.error("Authentication failed with a fresh token")
+            ws.close()
+            return
+        self._websocket_token_refreshed = True
+        self.websocket_logger.info("Authentication failed, refreshing token")
+        try:
+            self.get_token_from_api()
+        except (ApiException, requests.RequestException) as error:
+            self.websocket_logger.error("Could not refresh token: %s", error)
+            ws.close()
+            return
+        self._send_check_token(ws)
+
+    def _on_websocket_authenticated(self):
+        self._websocket_authenticated = True
+        if self._websocket_gap_pending:
+            self._websocket_gap_pending = False
+            if self.push_invalidations is not None:
+                self._invalidate_endpoints(
+                    {endpoint for endpoints in self.push_invalidations.values()
+                     for endpoint in endpoints}
+                )
+            if self.gap_callback is not None:
+                self.gap_callback(self.websocket_gaps)
+
+    def _on_auth(self, ws, event):
+        if event.success:
+            self.websocket_logger.info("Authentication successful!")
+            self._on_websocket_authenticated()
+        else:
+            self._refresh_websocket_token(ws)
+
+    def _on_notification_list_start(self, _, __):
+        self.websocket_logger.info("Notification list started.")
+
+    def _on_notification_config_request(self, ws, _):
+        self.websocket_logger.debug("Sending notification config")
+        ws.send(set_config_message())
+
+    # event class -> handler of the Websocket protocol, called before event_handlers
+    _PROTOCOL_HANDLERS = {
+        AuthEvent: _on_auth,
+        NotificationListStart: _on_notification_list_start,
+        NotificationConfigRequest: _on_notification_config_request,
+    }
 
     def ws_on_message(self, ws, message):
         """
         Websocket message
         """
-        self.websocket_logger.debug("Received message: %s", message)
-        message_data = json.loads(message)
-        message_type = message_data.get("type", None)
-        message_text = message_data.get("text", None)
-        message_request = message_data.get("request", None)
-
-        if message_type is not None:
-            if message_type == "auth" and message_request == "getToken":
-                self.websocket_logger.info("Authentication successful!")
-            elif message_type == "notificationListStart":
-                self.websocket_logger.info("Notification list started.")
-            elif message_type == "getNotificationConfig":
-                config_message = {
-                    "type": "setConfig",
-                    "queueUuid": uuid4().hex,
-                }
-                ws.send(json.dumps(config_message))
+        if self.websocket_logger.isEnabledFor(logging.DEBUG):
+            self.websocket_logger.debug("Received message: %s", message)
+        message_data = loads(message)
+        event = decode_event(message_data)
+        protocol_handler = self._PROTOCOL_HANDLERS.get(type(event))
+        if protocol_handler is not None:
+            protocol_handler(self, ws, event)
+        self.event_handlers.dispatch(event)
 
+        for events in self._notification_queues:
+            events.put(message_data)
+        if self._callback_dispatcher is None:
+            self._handle_received_message(message_data)
+
+    def _handle_received_message(self, message_data):
         if self.received_message_callback is not None:
             self.received_message_callback(message_data)
         else:
-            self.websocket_logger.info("Received message: %s", message_text)
+            self.websocket_logger.info("Received message: %s", message_data.get("text", None))
+
+    def run_websocket(self, reconnect: bool = True, ping_interval: float = 30,
+                      ping_timeout: float = 10, min_backoff: float = 1,
+                      max_backoff: float = 60):
+        """
+        Run Websocket, blocking until stop_websocket() is called
+
+        A dropped connection (including a ping that gets no pong within
+        ping_timeout) or a failure to get the token is retried after a
+        jittered exponential backoff, which is reset once a connection stays
+        up longer than max_backoff. A failed checkToken fetches a new token
+        with get_token_from_api() once.
+        Every drop of an authenticated connection counts as a gap in
+        websocket_gaps, and gap_callback(websocket_gaps) is called once the
+        stream is authenticated again, so notifications missed in between
+        can be caught up.
+
+        Args:
+            reconnect: reopen dropped connections, False returns after the first one
+            ping_interval: seconds between pings, 0 disables liveness detection
+            ping_timeout: seconds to wait for a pong, capped at half of ping_interval
+            min_backoff: first reconnect delay cap, in seconds
+            max_backoff: largest reconnect delay cap, in seconds
+        """
+        self._websocket_stop.clear()
+        self._run_websocket(reconnect, ping_interval, ping_timeout, min_backoff, max_backoff)
 
-    def run_websocket(self):
+    def _run_websocket(self, reconnect: bool = True, ping_interval: float = 30,
+                       ping_timeout: float = 10, min_backoff: float = 1,
+                       max_backoff: float = 60):
         """
-        Run Websocket
+        Reconnect loop of run_websocket, returns once the stop flag is set
+        """
+        import websocket  # pylint: disable=import-outside-toplevel
+        if ping_interval:
+            # websocket-client refuses a ping_timeout that is not below ping_interval
+            ping_timeout = min(ping_timeout, ping_interval / 2)
+        attempt = 0
+        while not self._websocket_stop.is_set():
+            if self._websocket_token_available(reconnect):
+                # only a connection that stayed up resets the backoff, a server
+                # dropping every connection right away is still backed off from
+                if self._connect_websocket(websocket, ping_interval, ping_timeout) > max_backoff:
+                    attempt = 0
+            if not reconnect or self._websocket_stop.is_set():
+                break
+            delay = backoff_delay(attempt, min_backoff, max_backoff)
+            attempt += 1
+            self.websocket_logger.info("Reconnecting to WebSocket in %.1f s", delay)
+            self._websocket_stop.wait(delay)
+        self._websocket = None
+
+    def _websocket_token_available(self, reconnect):
+        """
+        Get a token if there is none yet, False when that failed and will be retried
+        """
+        if self.user_token is not None:
+            return True
+        try:
+            self.get_token_from_api()
+        except (ApiException, requests.RequestException) as error:
+            if not reconnect:
+                raise
+            self.websocket_logger.error("Could not get token: %s", error)
+            return False
+        return True
+
+    def _connect_websocket(self, websocket, ping_interval, ping_timeout):
+        """
+        Run one Websocket connection until it drops
+
+        Returns:
+            seconds the connection stayed up once authenticated, 0 if it never was
         """
         self.websocket_logger.info("Connecting to WebSocket")
-        ws = websocket.WebSocketApp(
-            "wss://nodejs-gs.smartschool.be/smsc/websocket",
+        self._websocket_authenticated = False
+        self._websocket = websocket.WebSocketApp(
+            self.websocket_url,
             on_open=self.ws_on_open,
             on_message=self.ws_on_message,
             on_error=self.ws_on_error,
             on_close=self.ws_on_close
         )
-        ws.run_forever()
+        # stop_websocket() may have run before self._websocket was set
+        if self._websocket_stop.is_set():
+            return 0
+        connected_at = time.monotonic()
+        self._websocket.run_forever(ping_interval=ping_interval,
+                                    ping_timeout=ping_timeout if ping_interval else None)
+        if not self._websocket_authenticated:
+            return 0
+        self.websocket_gaps += 1
+        self._websocket_gap_pending = True
+        return time.monotonic() - connected_at
+
+    def start_websocket(self, **kwargs) -> threading.Thread:
+        """
+        Run the Websocket in a background thread, if it is not running yet
+
+        Args:
+            kwargs: run_websocket arguments
+        """
+        if self._websocket_thread is None or not self._websocket_thread.is_alive():
+            # cleared here, not in the thread, so a stop_websocket() right after this call holds
+            self._websocket_stop.clear()
+            self._websocket_thread = threading.Thread(
+                target=self._run_websocket_thread, kwargs=kwargs, name="smartschool-websocket",
+                daemon=True
+            )
+            self._websocket_thread.start()
+        return self._websocket_thread
+
+    def _run_websocket_thread(self, **kwargs):
+        """
+        Target of the start_websocket() thread
+
+        When the stream ends without stop_websocket(), e.g. on an error, every
+        subscribed queue is closed with that error so its consumers stop waiting.
+        """
+        error = None
+        try:
+            self._run_websocket(**kwargs)
+        except Exception as exception:  # pylint: disable=broad-exception-caught
+            error = exception
+            self.websocket_logger.exception("WebSocket thread failed")
+        finally:
+            if not self._websocket_stop.is_set():
+                for events in self._notification_queues:
+                    events.close(error)
+
+    def subscribe(self, maxsize: int = 1000, overflow: str = DROP_OLDEST) -> NotificationQueue:
+        """
+        Get a queue receiving every Websocket message, closing it unsubscribes
+
+        Args:
+            maxsize: maximum number of queued messages
+            overflow: what to do when the queue is full, DROP_OLDEST, BLOCK or COALESCE
+        """
+        events = NotificationQueue(maxsize, overflow)
+        events.on_close = self.unsubscribe
+        # copied on write, the receive thread iterates without a lock
+        self._notification_queues = [*self._notification_queues, events]
+        return events
+
+    def unsubscribe(self, events: NotificationQueue):
+        """
+        Stop feeding a queue from subscribe()
+        """
+        self._notification_queues = [
+            subscribed for subscribed in self._notification_queues if subscribed is not events
+        ]
+
+    def notifications(self, maxsize: int = 1000, overflow: str = DROP_OLDEST) -> NotificationQueue:
+        """
+        Subscribe to the Websocket messages and start the Websocket in the background
+
+        Iteration ends when the background Websocket stops on its own, raising
+        the error that stopped it if there was one.
+
+        Usage:
+            with client.notifications() as events:
+                for event in events:
+                    ...
+
+            async with client.notifications(overflow=COALESCE) as events:
+                async for event in events:
+                    ...
+        """
+        events = self.subscribe(maxsize, overflow)
+        self.start_websocket()
+        return events
+
+    def dispatch_callbacks(self, workers: int = 4, maxsize: int = 1000, overflow: str = BLOCK):
+        """
+        Call received_message_callback from worker threads instead of the receive thread
+
+        Messages wait in a bounded queue between the two, so a slow callback
+        no longer stalls the Websocket; workers=0 goes back to calling it inline.
+        """
+        if self._callback_dispatcher is not None:
+            self._callback_dispatcher.close(wait=False)
+            self._callback_dispatcher = None
+        if workers > 0:
+            self._callback_dispatcher = CallbackDispatcher(
+                self.subscribe(maxsize, overflow), self._handle_received_message, workers,
+                self.websocket_logger
+            )
+
+    def stop_websocket(self):
+        """
+        Close the Websocket and make run_websocket() return
+        """
+        self._websocket_stop.set()
+        websocket_app = self._websocket
+        if websocket_app is not None:
+            websocket_app.close()